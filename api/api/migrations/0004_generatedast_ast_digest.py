@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_generatedast_framework'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedast',
+            name='ast_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
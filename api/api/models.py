@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
 from django.utils.translation import gettext_lazy as _
+from utils.dsl.ast_cache import compute_ast_digest
 
 
 class ScoreLevel(models.TextChoices):
@@ -19,6 +20,7 @@ class GeneratedAST(models.Model):
     task_ids = ArrayField(models.CharField(max_length=255), blank=True, null=True)
     language = models.CharField(max_length=50, default="rust", blank=True, null=True)
     framework = models.CharField(max_length=50, default="unknown", blank=True, null=True)
+    ast_digest = models.CharField(max_length=64, blank=True, null=True)
 
     class SourceTypeOptions(models.TextChoices):
         FILE = "file"
@@ -26,6 +28,14 @@ class GeneratedAST(models.Model):
 
     source_type = models.CharField(choices=SourceTypeOptions.choices)
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "ast" in update_fields:
+            self.ast_digest = compute_ast_digest(self.ast)
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "ast_digest"]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         if self.source_type == self.SourceTypeOptions.FILE:
             return self.file_path if self.file_path else "Bad filepath"
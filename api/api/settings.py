@@ -141,6 +141,25 @@ CELERY_RESULT_BACKEND = "django-db"
 CELERY_CACHE_BACKEND = "django-cache"
 CELERY_RESULT_EXTENDED = True
 
+# Memory budget of the parsed AST caches of a celery worker, see utils/dsl/ast_cache.py. The
+# caches are process-local, so with the prefork pool each child gets budget / concurrency
+RADAR_AST_CACHE_MAX_BYTES = int(os.getenv("RADAR_AST_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Also build the NumPy columnar store of parsed ASTs, see utils/dsl/ast_columns.py. NumPy is
+# an optional dependency, installed with the columnar extra (poetry install --extras columnar)
+RADAR_COLUMNAR_AST = os.getenv("RADAR_COLUMNAR_AST", "False").lower() == "true"
+
+# Evaluate DSL calls chained on node lists as fused lazy plans, see ASTNodeList.from_plan
+RADAR_LAZY_DSL_QUERIES = os.getenv("RADAR_LAZY_DSL_QUERIES", "False").lower() == "true"
+
+# Directory persisting compiled template rules across worker restarts, memory only when empty.
+# Cached rules are not validated again, so it must only be writable by the workers
+RADAR_TEMPLATE_CODE_CACHE_DIR = os.getenv("RADAR_TEMPLATE_CODE_CACHE_DIR", "")
+
+# Worker processes generating the ASTs of the programs of a Rust workspace, see utils/ast.py
+# map_programs. 1 keeps generation in the request's process
+RADAR_AST_WORKERS = int(os.getenv("RADAR_AST_WORKERS", 1))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -1,29 +1,158 @@
+import logging
+from pathlib import Path
+import traceback
+
 from api.models import GeneratedAST
-from celery import shared_task
-from utils.dsl.dsl import extract_json_output, inject_code_lines, process_template_outputs, wrapped_exec
+from celery import shared_task, states
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import task_failure, worker_init
+from django.conf import settings
+from utils.dsl.ast_cache import ParsedASTCache, compute_ast_digest
+from utils.dsl.dsl import (
+    compiled_code_cache,
+    process_template_outputs,
+    warm_code_cache,
+    wrapped_exec,
+)
+from utils.dsl.dsl_ast_iterator import parse_ast
+from utils.dsl.query_cache import query_cache_stats
+from utils.dsl.tracing import tracing
+
+logger = logging.getLogger(__name__)
+
+if settings.RADAR_COLUMNAR_AST:
+    # Fails when the worker starts rather than on the first scan if NumPy is missing
+    import utils.dsl.ast_columns  # noqa: F401
+
+# Process-local, so every prefork child keeps its own parsed trees, within its share of
+# RADAR_AST_CACHE_MAX_BYTES (see split_parsed_ast_cache_budget)
+parsed_ast_cache = ParsedASTCache(settings.RADAR_AST_CACHE_MAX_BYTES)
+compiled_code_cache.directory = settings.RADAR_TEMPLATE_CODE_CACHE_DIR or None
+
+
+@worker_init.connect
+def warm_template_code_cache(**kwargs):
+    # Runs in the main worker process before the pool forks, so every child starts with the
+    # builtin template rules already validated and compiled
+    warmed = warm_code_cache(Path("builtin_templates").absolute())
+    logger.info(f"Compiled {warmed} builtin template rules: {compiled_code_cache.stats()}")
+
+
+@worker_init.connect
+def split_parsed_ast_cache_budget(sender=None, **kwargs):
+    # Runs in the main worker process before the pool forks. RADAR_AST_CACHE_MAX_BYTES budgets
+    # the whole worker, so each of the prefork children caches within an equal share of it
+    pool_cls = getattr(sender, "pool_cls", None)
+    if isinstance(pool_cls, type) and issubclass(pool_cls, PreforkPool):
+        children = max(1, sender.concurrency)
+        parsed_ast_cache.max_bytes = settings.RADAR_AST_CACHE_MAX_BYTES // children
+        logger.info(f"Parsed AST cache budget per worker process: {parsed_ast_cache.max_bytes}")
+
+
+def load_parsed_ast(generated_ast_id, language: str) -> dict:
+    # Only the digest is fetched up front, the AST JSON is decoded and parsed on a cache miss
+    ast_digest = GeneratedAST.objects.values_list("ast_digest", flat=True).get(
+        id=generated_ast_id
+    )
+
+    def parse(ast_data=None):
+        if ast_data is None:
+            ast_data = GeneratedAST.objects.values_list("ast", flat=True).get(
+                id=generated_ast_id
+            )
+        return parse_ast(
+            ast_data,
+            language,
+            columnar=settings.RADAR_COLUMNAR_AST,
+            lazy=settings.RADAR_LAZY_DSL_QUERIES,
+        )
+
+    ast_data = None
+    if ast_digest is None:
+        # Rows stored before the digest existed get it on their first scan
+        ast_data = GeneratedAST.objects.values_list("ast", flat=True).get(id=generated_ast_id)
+        ast_digest = compute_ast_digest(ast_data)
+        if ast_digest is None:
+            return parse(ast_data)
+        GeneratedAST.objects.filter(id=generated_ast_id, ast_digest__isnull=True).update(
+            ast_digest=ast_digest
+        )
+
+    roots = parsed_ast_cache.get_or_parse(
+        (generated_ast_id, ast_digest, language), lambda: parse(ast_data)
+    )
+    logger.debug(f"Parsed AST cache stats: {parsed_ast_cache.stats()}")
+    return roots
+
+
+def execute_template(yaml_data, roots: dict, trace: bool = False) -> dict:
+    task_result = {
+        "name": yaml_data["name"],
+        "severity": yaml_data["severity"],
+        "certainty": yaml_data["certainty"],
+        "description": yaml_data["description"],
+    }
+
+    code = yaml_data["rule"]
+    reported = []
+    with tracing(trace) as dsl_trace:
+        template_outputs = wrapped_exec(code, {"ast": roots.items()}, reported)
+    print(template_outputs)
+    logger.debug(f"DSL query cache stats: {query_cache_stats(roots)}")
+    logger.debug(f"Compiled rule cache stats: {compiled_code_cache.stats()}")
+
+    task_result["results"] = process_template_outputs(template_outputs, yaml_data, reported)
+    if dsl_trace is not None:
+        task_result["results"]["trace"] = dsl_trace.events
+    return task_result
 
 
 @shared_task
-def run_scan_task(yaml_data, generated_ast_id):
-    generated_ast = GeneratedAST.objects.get(id=generated_ast_id)
-    try:       
-        task_result = {
-            "name": yaml_data["name"],
-            "severity": yaml_data["severity"],
-            "certainty": yaml_data["certainty"],
-            "description": yaml_data["description"],
-        }
-
-        code = yaml_data["rule"]
+def run_scan_task(yaml_data, generated_ast_id, trace=False):
+    try:
         template_language = yaml_data.get("language", "rust")
-        code = inject_code_lines(code, [f"ast = parse_ast({generated_ast.ast}, '{template_language}').items()"])
-
-        template_outputs = wrapped_exec(code)
-        print(template_outputs)
+        roots = load_parsed_ast(generated_ast_id, template_language)
 
         # Save to task results backend and end task successfully
-        task_result["results"] = process_template_outputs(template_outputs, yaml_data)
-        return task_result
+        return execute_template(yaml_data, roots, trace)
 
     except GeneratedAST.DoesNotExist:
         print(f"[e] No matching GeneratedAST found")
+
+
+@shared_task(bind=True)
+def run_scan_bundle_task(self, templates, generated_ast_id, trace=False):
+    """Run a list of templates in sequence over one parsed AST.
+
+    Each entry of templates is a dict with the template's yaml_data and the task_id its result is
+    stored under, so results are polled exactly like the ones of run_scan_task.
+    """
+    for template in templates:
+        yaml_data = template["yaml_data"]
+        task_id = template["task_id"]
+        try:
+            roots = load_parsed_ast(generated_ast_id, yaml_data.get("language", "rust"))
+            task_result = execute_template(yaml_data, roots, trace)
+        except Exception as e:
+            self.backend.mark_as_failure(task_id, e, traceback=traceback.format_exc())
+            continue
+        self.backend.mark_as_done(task_id, task_result)
+
+    return [template["task_id"] for template in templates]
+
+
+@task_failure.connect
+def fail_unfinished_bundle_templates(sender=None, exception=None, kwargs=None, **extra):
+    """Mark the templates a failed bundle task did not finish as failed.
+
+    Their results are only written by the bundle task, so without this they would stay pending
+    and polling the scan would never end. Runs in the process running the task when it raises,
+    and in the main worker process when that process was lost (e.g. killed).
+    """
+    if getattr(sender, "name", None) != run_scan_bundle_task.name:
+        return
+    for template in (kwargs or {}).get("templates", []):
+        task_id = template["task_id"]
+        if sender.backend.get_state(task_id) not in states.READY_STATES:
+            sender.backend.mark_as_failure(task_id, exception)
+
@@ -5,7 +5,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from api.models import GeneratedAST
-from api.tasks import run_scan_task
+from api.tasks import run_scan_bundle_task, run_scan_task
 from utils.ast import (
     generate_aggregate_program_ast,
     generate_ast_for_anchor_project,
@@ -13,6 +13,7 @@ from utils.ast import (
     generate_ast_for_rust_program,
 )
 from celery.result import AsyncResult
+from django.conf import settings
 
 
 from .serializers import GenerateASTSerializer
@@ -135,7 +136,9 @@ class GenerateASTView(APIView):
                         )
                 elif (source_file_path / "Anchor.toml").exists():
                     try:
-                        ast_data = generate_ast_for_anchor_project(source_file_path)
+                        ast_data = generate_ast_for_anchor_project(
+                            source_file_path, settings.RADAR_AST_WORKERS
+                        )
                     except Exception as e:
                         logger.error(e)
                         return Response(
@@ -148,7 +151,9 @@ class GenerateASTView(APIView):
                 # last check for multiple programs within a folder, or quit trying
                 else:
                     try:
-                        ast_data = generate_aggregate_program_ast(source_file_path)
+                        ast_data = generate_aggregate_program_ast(
+                            source_file_path, settings.RADAR_AST_WORKERS
+                        )
                         if ast_data is None:
                             raise ValueError(
                                 "No Cargo.toml files found in any subdirectories."
@@ -183,6 +188,12 @@ class RunScanView(APIView):
         source_type = request.data.get("source_type")
         source_path = request.data.get(f"{source_type}_path")
         templates_path = request.data.get("templates_path")
+        # "fanout" dispatches one task per template, "bundle" runs the templates in sequence
+        # within bundle_shards tasks that share a parsed AST
+        execution_mode = request.data.get("execution_mode", "fanout")
+        bundle_shards = request.data.get("bundle_shards", 1)
+        # Record structured events of the DSL calls made by the templates, see utils/dsl/tracing.py
+        trace = str(request.data.get("trace", False)).lower() == "true"
 
         if not source_path or not source_type:
             return Response(
@@ -190,6 +201,22 @@ class RunScanView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        if execution_mode not in ["fanout", "bundle"]:
+            return Response(
+                {"error": 'execution_mode must be either "fanout" or "bundle"'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            bundle_shards = int(bundle_shards)
+            if bundle_shards < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "bundle_shards must be a positive integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         if templates_path:
             # Handle both absolute and relative template paths
             if Path(templates_path).is_absolute():
@@ -212,7 +239,7 @@ class RunScanView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        task_ids = []
+        selected_templates = []
         query = {"source_type": source_type, f"{source_type}_path": source_path}
         generated_ast = (
             GeneratedAST.objects.filter(**query).order_by("-created").first()
@@ -244,18 +271,42 @@ class RunScanView(APIView):
                 if detected_language == "rust" and template_accent and detected_framework != "unknown":
                     if template_accent != detected_framework:
                         continue
-                
+
+                selected_templates.append(yaml_data)
+
+        task_ids = []
+        if execution_mode == "bundle":
+            templates = [
+                {"task_id": yaml_data["name"], "yaml_data": yaml_data}
+                for yaml_data in selected_templates
+            ]
+            for template in templates:
+                # Per-template results are written by the bundle tasks, so clear results of a previous scan
+                run_scan_bundle_task.backend.forget(template["task_id"])
+                task_ids.append(template["task_id"])
+
+            for shard_index in range(min(bundle_shards, len(templates))):
+                run_scan_bundle_task.apply_async(
+                    kwargs={
+                        "templates": templates[shard_index::bundle_shards],
+                        "generated_ast_id": generated_ast.id,
+                        "trace": trace,
+                    },
+                )
+        else:
+            for yaml_data in selected_templates:
                 result = run_scan_task.apply_async(
                     kwargs={
                         "yaml_data": yaml_data,
                         "generated_ast_id": generated_ast.id,
+                        "trace": trace,
                     },
                     task_id=yaml_data["name"],
                 )
                 task_ids.append(result.id)
 
         generated_ast.task_ids = task_ids
-        generated_ast.save()
+        generated_ast.save(update_fields=["task_ids"])
 
         return Response({"message": "Scan initiated"}, status=status.HTTP_201_CREATED)
 
@@ -295,6 +346,7 @@ class PollResultsView(APIView):
                     if task_result_results and (
                         task_result_results.get("locations")
                         or task_result_results.get("debug")
+                        or task_result_results.get("trace")
                     ):
                         results.append(task_result_results)
                 else:
@@ -1,29 +1,252 @@
 /*
     build with cargo and place the .so as rust_syn.so in working directory
+    test with cargo test --no-default-features (the default extension-module feature leaves the
+    python symbols to the interpreter, so test binaries would not link)
     then, from python:
-    
+
     import rust_syn
     ast_json = rust_syn.parse_rust_to_ast(rust_code)
+    ast_json_bytes = rust_syn.parse_rust_to_json(rust_code, prune_unused=True)
+    ast_json_bytes_list = rust_syn.parse_many([rust_code, other_rust_code], prune_unused=True)
 */
 
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::thread;
+
 use pyo3::prelude::*;
 use pyo3::exceptions::PyValueError;
+use pyo3::types::PyBytes;
 use pyo3::types::PyModule;
 use pyo3::types::PyModule as _PyModule;
 use syn::{parse_str, File};
 use syn_serde::json;
 
+// syn-serde keys radar never reads: the spacing of punctuation in macro token streams and the
+// presence flags of optional separator tokens
+const UNUSED_KEYS: &[&[u8]] = &[b"spacing", b"colon_token", b"semi_token"];
+
+fn parse_file(rust_code: &str) -> PyResult<File> {
+    parse_str(rust_code)
+        .map_err(|e| PyErr::new::<PyValueError, _>(format!("Error parsing Rust code: {}", e)))
+}
+
+// End offset of the `"key":value` member starting at start, if its key is unused and its value
+// is a scalar
+fn unused_member_end(json: &[u8], start: usize) -> Option<usize> {
+    for key in UNUSED_KEYS {
+        let value_start = start + key.len() + 3;
+        if json.len() <= value_start
+            || &json[start + 1..start + 1 + key.len()] != *key
+            || &json[start + 1 + key.len()..value_start] != b"\":"
+        {
+            continue;
+        }
+
+        let mut end = value_start;
+        match json[value_start] {
+            b'{' | b'[' => return None,
+            b'"' => {
+                end += 1;
+                while json[end] != b'"' {
+                    end += if json[end] == b'\\' { 2 } else { 1 };
+                }
+                end += 1;
+            }
+            _ => {
+                while !matches!(json[end], b',' | b'}' | b']') {
+                    end += 1;
+                }
+            }
+        }
+        return Some(end);
+    }
+    None
+}
+
+// Drops the unused members from compact JSON in a single pass. Working on the serialized bytes
+// keeps the syn field order, which a serde_json::Value round trip would sort
+fn prune_unused_keys(json: &[u8]) -> Vec<u8> {
+    let mut pruned = Vec::with_capacity(json.len());
+    let mut in_string = false;
+    let mut i = 0;
+    while i < json.len() {
+        let byte = json[i];
+        if in_string {
+            pruned.push(byte);
+            if byte == b'\\' {
+                pruned.push(json[i + 1]);
+                i += 2;
+                continue;
+            }
+            in_string = byte != b'"';
+            i += 1;
+            continue;
+        }
+
+        if byte == b'"' {
+            if let Some(&previous @ (b'{' | b',')) = pruned.last() {
+                if let Some(mut end) = unused_member_end(json, i) {
+                    if previous == b',' {
+                        pruned.pop();
+                    } else if json[end] == b',' {
+                        end += 1;
+                    }
+                    i = end;
+                    continue;
+                }
+            }
+            in_string = true;
+        }
+        pruned.push(byte);
+        i += 1;
+    }
+    pruned
+}
+
+fn to_json_bytes(rust_code: &str, prune_unused: bool) -> Result<Vec<u8>, String> {
+    let syn_file: File =
+        parse_str(rust_code).map_err(|e| format!("Error parsing Rust code: {}", e))?;
+    let json_bytes = json::to_string(&syn_file).into_bytes();
+    if prune_unused {
+        return Ok(prune_unused_keys(&json_bytes));
+    }
+    Ok(json_bytes)
+}
+
 #[pyfunction]
 fn parse_rust_to_ast(rust_code: String) -> PyResult<String> {
-    let syn_file: File = parse_str(&rust_code)
-        .map_err(|e| PyErr::new::<PyValueError, _>(format!("Error parsing Rust code: {}", e)))?;
+    let syn_file = parse_file(&rust_code)?;
     let json_string = json::to_string_pretty(&syn_file);
     Ok(json_string)
 }
 
+// Compact JSON bytes of the syn tree, optionally without the keys radar never reads.
+// json.loads takes the bytes as is, without the indentation of parse_rust_to_ast
+#[pyfunction]
+#[pyo3(signature = (rust_code, prune_unused=false))]
+fn parse_rust_to_json<'py>(
+    py: Python<'py>,
+    rust_code: &str,
+    prune_unused: bool,
+) -> PyResult<Bound<'py, PyBytes>> {
+    let json_bytes = to_json_bytes(rust_code, prune_unused).map_err(PyValueError::new_err)?;
+    Ok(PyBytes::new_bound(py, &json_bytes))
+}
+
+// parse_rust_to_json over many sources, returned in the same order. The sources are parsed and
+// serialized on one thread per core with the GIL released, each thread taking the next source
+// as it finishes one, since file sizes vary a lot
+#[pyfunction]
+#[pyo3(signature = (rust_codes, prune_unused=false))]
+fn parse_many(
+    py: Python<'_>,
+    rust_codes: Vec<String>,
+    prune_unused: bool,
+) -> PyResult<Vec<Py<PyBytes>>> {
+    let results = py.allow_threads(|| {
+        let workers = thread::available_parallelism()
+            .map(|n| n.get())
+            .unwrap_or(1)
+            .min(rust_codes.len());
+        let next = &AtomicUsize::new(0);
+        let rust_codes = &rust_codes;
+        let mut results: Vec<Option<Result<Vec<u8>, String>>> = vec![None; rust_codes.len()];
+        thread::scope(|scope| {
+            let handles: Vec<_> = (0..workers)
+                .map(|_| {
+                    scope.spawn(move || {
+                        let mut parsed = Vec::new();
+                        loop {
+                            let index = next.fetch_add(1, Ordering::Relaxed);
+                            if index >= rust_codes.len() {
+                                break;
+                            }
+                            parsed.push((index, to_json_bytes(&rust_codes[index], prune_unused)));
+                        }
+                        parsed
+                    })
+                })
+                .collect();
+            for handle in handles {
+                for (index, result) in handle.join().expect("Rust parser thread panicked") {
+                    results[index] = Some(result);
+                }
+            }
+        });
+        results
+    });
+
+    results
+        .into_iter()
+        .enumerate()
+        .map(|(index, result)| match result {
+            Some(Ok(json_bytes)) => Ok(PyBytes::new_bound(py, &json_bytes).unbind()),
+            Some(Err(e)) => Err(PyValueError::new_err(format!("{} (source {})", e, index))),
+            None => Err(PyValueError::new_err(format!("Source {} was not parsed", index))),
+        })
+        .collect()
+}
+
 
 #[pymodule]
 fn rust_syn(_py: Python, m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(parse_rust_to_ast, m)?)?;
+    m.add_function(wrap_pyfunction!(parse_rust_to_json, m)?)?;
+    m.add_function(wrap_pyfunction!(parse_many, m)?)?;
     Ok(())
-}
\ No newline at end of file
+}
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn pruned(json: &[u8]) -> String {
+        String::from_utf8(prune_unused_keys(json)).unwrap()
+    }
+
+    #[test]
+    fn prunes_unused_members_at_any_position() {
+        assert_eq!(pruned(br#"{"spacing":"alone"}"#), "{}");
+        assert_eq!(pruned(br#"{"spacing":"alone","op":"+"}"#), r#"{"op":"+"}"#);
+        assert_eq!(pruned(br#"{"op":"+","spacing":"joint"}"#), r#"{"op":"+"}"#);
+    }
+
+    #[test]
+    fn keeps_escaped_strings_intact() {
+        assert_eq!(
+            pruned(br#"{"a":"x\"spacing\":1","spacing":"alone","b":1}"#),
+            r#"{"a":"x\"spacing\":1","b":1}"#
+        );
+        assert_eq!(pruned(br#"{"a":"\\","spacing":"alone"}"#), r#"{"a":"\\"}"#);
+        assert_eq!(
+            pruned(br#"{"lit":"\"semi_token\":true,","semi_token":true}"#),
+            r#"{"lit":"\"semi_token\":true,"}"#
+        );
+    }
+
+    #[test]
+    fn prunes_nested_members() {
+        assert_eq!(
+            pruned(
+                br#"{"punct":{"op":"+","spacing":"alone"},"colon_token":true,"stmts":[{"semi_token":false,"expr":{}}]}"#
+            ),
+            r#"{"punct":{"op":"+"},"stmts":[{"expr":{}}]}"#
+        );
+    }
+
+    #[test]
+    fn keeps_values_and_keys_that_only_look_unused() {
+        let json = br#"{"op":"spacing","spacings":1,"spacing":{"kept":1},"colon_token":["kept"]}"#;
+        assert_eq!(pruned(json), String::from_utf8(json.to_vec()).unwrap());
+    }
+
+    #[test]
+    fn pruned_json_of_a_source_is_the_pruned_compact_json() {
+        let rust_code = "fn f(a: u8) -> u8 { let b = a + 1; b }";
+        let compact = to_json_bytes(rust_code, false).unwrap();
+        let pruned_json = to_json_bytes(rust_code, true).unwrap();
+        assert_eq!(pruned_json, prune_unused_keys(&compact));
+        assert!(!String::from_utf8(pruned_json).unwrap().contains("\"semi_token\""));
+    }
+}
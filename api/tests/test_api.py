@@ -0,0 +1,204 @@
+from types import SimpleNamespace
+import django
+from django.conf import settings
+import pytest
+
+if not settings.configured:
+    # The project settings need Postgres and RabbitMQ, the views and tasks below only need the
+    # apps, the RADAR_* settings and a result backend
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "rest_framework",
+            "api",
+        ],
+        CELERY_RESULT_BACKEND="cache+memory://",
+        RADAR_AST_CACHE_MAX_BYTES=64 * 1024 * 1024,
+        RADAR_COLUMNAR_AST=False,
+        RADAR_LAZY_DSL_QUERIES=False,
+        RADAR_TEMPLATE_CODE_CACHE_DIR="",
+        RADAR_AST_WORKERS=1,
+    )
+    django.setup()
+
+from billiard.exceptions import WorkerLostError
+from celery import states
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.concurrency.thread import TaskPool as ThreadPool
+from celery.signals import task_failure
+from rest_framework.test import APIRequestFactory
+from api import tasks, views
+from utils.dsl.dsl_ast_iterator import parse_ast
+
+SCAN_AST = {
+    "items": [
+        {
+            "fn": {
+                "ident": "f",
+                "src": {"file": "lib.rs", "line": 1, "start_col": 4, "end_col": 5},
+            }
+        }
+    ]
+}
+
+
+def template(name, rule):
+    return {
+        "task_id": name,
+        "yaml_data": {
+            "name": name,
+            "description": "d",
+            "severity": "Low",
+            "certainty": "Low",
+            "rule": rule,
+        },
+    }
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(
+        tasks, "load_parsed_ast", lambda generated_ast_id, language: parse_ast(SCAN_AST)
+    )
+    return tasks.run_scan_bundle_task.backend
+
+
+def test_bundle_task_stores_a_result_per_template(backend):
+    report_code = "for source, nodes in ast:\n    report(nodes.find_by_names({!r}))"
+    templates = [
+        template("bundle-finds-f", report_code.format("f")),
+        template("bundle-raises", "print(undefined)"),
+        template("bundle-finds-nothing", report_code.format("g")),
+    ]
+
+    result = tasks.run_scan_bundle_task.apply(
+        kwargs={"templates": templates, "generated_ast_id": 1}
+    )
+
+    assert result.get() == ["bundle-finds-f", "bundle-raises", "bundle-finds-nothing"]
+    found = backend.get_task_meta("bundle-finds-f")
+    assert found["status"] == states.SUCCESS
+    assert found["result"]["results"]["locations"] == ["lib.rs:1:4-5"]
+    assert backend.get_state("bundle-raises") == states.FAILURE
+    assert isinstance(backend.get_result("bundle-raises"), NameError)
+    assert backend.get_task_meta("bundle-finds-nothing")["result"]["results"]["locations"] == []
+
+
+def test_lost_bundle_task_fails_its_unfinished_templates(backend):
+    templates = [template(f"lost-bundle-{index}", "print(1)") for index in range(3)]
+    backend.mark_as_done("lost-bundle-0", {"results": {}})
+
+    # What the main worker process sends once the process running the bundle is killed
+    task_failure.send(
+        sender=tasks.run_scan_bundle_task,
+        task_id="lost-bundle",
+        exception=WorkerLostError("Worker exited prematurely: signal 9 (SIGKILL)."),
+        args=[],
+        kwargs={"templates": templates, "generated_ast_id": 1},
+        traceback=None,
+        einfo=None,
+    )
+
+    assert backend.get_state("lost-bundle-0") == states.SUCCESS
+    assert backend.get_state("lost-bundle-1") == states.FAILURE
+    assert isinstance(backend.get_result("lost-bundle-2"), WorkerLostError)
+
+    # Failures of other tasks leave their kwargs alone
+    task_failure.send(
+        sender=tasks.run_scan_task,
+        task_id="other",
+        exception=WorkerLostError(),
+        args=[],
+        kwargs={"templates": [template("not-a-bundle", "print(1)")]},
+        traceback=None,
+        einfo=None,
+    )
+    assert backend.get_state("not-a-bundle") == states.PENDING
+
+
+def test_prefork_children_split_the_parsed_ast_cache_budget(monkeypatch):
+    monkeypatch.setattr(tasks.parsed_ast_cache, "max_bytes", tasks.parsed_ast_cache.max_bytes)
+
+    tasks.split_parsed_ast_cache_budget(sender=SimpleNamespace(pool_cls=ThreadPool, concurrency=8))
+    assert tasks.parsed_ast_cache.max_bytes == 64 * 1024 * 1024
+
+    tasks.split_parsed_ast_cache_budget(sender=SimpleNamespace(pool_cls=PreforkPool, concurrency=8))
+    assert tasks.parsed_ast_cache.max_bytes == 8 * 1024 * 1024
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    generated_ast = SimpleNamespace(
+        id=7, language="rust", framework="unknown", task_ids=None, save=lambda **kwargs: None
+    )
+    query = SimpleNamespace(order_by=lambda *fields: SimpleNamespace(first=lambda: generated_ast))
+    objects = SimpleNamespace(filter=lambda **kwargs: query)
+    monkeypatch.setattr(views, "GeneratedAST", SimpleNamespace(objects=objects))
+
+    dispatched = SimpleNamespace(generated_ast=generated_ast, bundles=[], tasks=[])
+    monkeypatch.setattr(
+        views.run_scan_bundle_task,
+        "apply_async",
+        lambda kwargs: dispatched.bundles.append(kwargs),
+    )
+    monkeypatch.setattr(
+        views.run_scan_task,
+        "apply_async",
+        lambda kwargs, task_id: dispatched.tasks.append(kwargs) or SimpleNamespace(id=task_id),
+    )
+    return dispatched
+
+
+def run_scan(**data):
+    request = APIRequestFactory().post(
+        "/run_scan/", {"source_type": "file", "file_path": "lib.rs", **data}, format="json"
+    )
+    return views.RunScanView.as_view()(request)
+
+
+def test_run_scan_rejects_invalid_bundle_options(dispatched):
+    for data in [
+        {"execution_mode": "serial"},
+        {"execution_mode": "bundle", "bundle_shards": 0},
+        {"execution_mode": "bundle", "bundle_shards": "two"},
+    ]:
+        assert run_scan(**data).status_code == 400
+    assert dispatched.bundles == [] and dispatched.tasks == []
+
+
+def test_run_scan_fanout_dispatches_a_task_per_template(dispatched):
+    assert run_scan(trace="false").status_code == 201
+
+    task_ids = dispatched.generated_ast.task_ids
+    assert task_ids and len(set(task_ids)) == len(task_ids)
+    assert [kwargs["yaml_data"]["name"] for kwargs in dispatched.tasks] == task_ids
+    assert all(
+        kwargs["generated_ast_id"] == 7 and kwargs["trace"] is False for kwargs in dispatched.tasks
+    )
+    assert dispatched.bundles == []
+
+
+def test_run_scan_bundle_shards_templates_round_robin(dispatched):
+    stale_task_id = None
+    for bundle_shards, trace in [(3, "true"), ("1", True)]:
+        if stale_task_id:
+            tasks.run_scan_bundle_task.backend.mark_as_done(stale_task_id, {"results": {}})
+        dispatched.bundles.clear()
+
+        response = run_scan(execution_mode="bundle", bundle_shards=bundle_shards, trace=trace)
+
+        assert response.status_code == 201
+        task_ids = dispatched.generated_ast.task_ids
+        shards = int(bundle_shards)
+        assert len(dispatched.bundles) == shards
+        for shard_index, kwargs in enumerate(dispatched.bundles):
+            shard_task_ids = [entry["task_id"] for entry in kwargs["templates"]]
+            assert shard_task_ids == task_ids[shard_index::shards]
+            assert kwargs["generated_ast_id"] == 7 and kwargs["trace"] is True
+        assert dispatched.tasks == []
+
+        # Results of the previous scan are cleared, so polling waits for the new ones
+        if stale_task_id:
+            assert tasks.run_scan_bundle_task.backend.get_state(stale_task_id) == states.PENDING
+        stale_task_id = task_ids[0]
@@ -1,5 +1,9 @@
+import json
 from pathlib import Path
 from utils.ast import (
+    enrich_ast_with_source_lines,
+    generate_ast_for_rust_files,
+    map_programs,
     generate_aggregate_program_ast,
     generate_ast_for_anchor_project,
     generate_anchor_project_derived_program_ast,
@@ -13,8 +17,8 @@ mock_rust_syn_ast = {
 
 def test_generate_ast_for_anchor_project(monkeypatch):
     monkeypatch.setattr(
-        "utils.ast.generate_ast_for_rust_file",
-        lambda *args, **kwargs: mock_rust_syn_ast,
+        "utils.ast.generate_ast_for_rust_files",
+        lambda rs_files, *args, **kwargs: {str(rs_file): mock_rust_syn_ast for rs_file in rs_files},
     )
     source_path = Path("tests/mocks/anchor-test")
     result = generate_ast_for_anchor_project(source_path)
@@ -28,8 +32,8 @@ def test_generate_ast_for_anchor_project(monkeypatch):
 
 def test_generate_anchor_project_derived_program_ast(monkeypatch):
     monkeypatch.setattr(
-        "utils.ast.generate_ast_for_rust_file",
-        lambda *args, **kwargs: mock_rust_syn_ast,
+        "utils.ast.generate_ast_for_rust_files",
+        lambda rs_files, *args, **kwargs: {str(rs_file): mock_rust_syn_ast for rs_file in rs_files},
     )
     program_path = Path("tests/mocks/anchor-test/programs/anchor-test")
     result = generate_anchor_project_derived_program_ast(program_path)
@@ -44,8 +48,8 @@ def test_generate_anchor_project_derived_program_ast(monkeypatch):
 
 def test_generate_aggregate_program_ast(monkeypatch):
     monkeypatch.setattr(
-        "utils.ast.generate_ast_for_rust_file",
-        lambda *args, **kwargs: mock_rust_syn_ast,
+        "utils.ast.generate_ast_for_rust_files",
+        lambda rs_files, *args, **kwargs: {str(rs_file): mock_rust_syn_ast for rs_file in rs_files},
     )
     base_path = Path("tests/mocks/anchor-test-2/programs")
     result = generate_aggregate_program_ast(base_path)
@@ -64,3 +68,91 @@ def test_generate_aggregate_program_ast(monkeypatch):
         )
         is not None
     )
+
+
+def test_enrich_ast_with_source_lines_resolves_lines_and_columns():
+    rust_code = "fn main() {\n    let amount = 1;\n\n  amount\n}"
+    items = [{"ident": "main"}, {"ident": "amount"}, {"lit": {"int": "1"}}]
+    enrich_ast_with_source_lines(items, rust_code, Path("lib.rs"))
+
+    assert items[0]["src"] == {"file": "lib.rs", "line": 1, "start_col": 4, "end_col": 8}
+    assert items[1]["src"] == {"file": "lib.rs", "line": 2, "start_col": 9, "end_col": 15}
+    assert items[2]["lit"]["src"] == {"file": "lib.rs", "line": 2, "start_col": 18, "end_col": 19}
+
+
+def test_enrich_ast_with_source_lines_maps_every_node_to_the_first_occurrence():
+    rust_code = (
+        "fn f(owner: u64) -> u64 {\n"
+        "    let amount = owner;\n"
+        "    amount + amount\n"
+        "}"
+    )
+    items = [{"ident": "owner"}, {"ident": "amount"}, {"ident": "amount"}, {"ident": "amount"}]
+    enrich_ast_with_source_lines(items, rust_code, Path("lib.rs"))
+
+    assert [item["src"]["line"] for item in items] == [1, 2, 2, 2]
+    assert items[3]["src"] == {"file": "lib.rs", "line": 2, "start_col": 9, "end_col": 15}
+
+
+def test_generate_ast_for_rust_files_parses_all_files_in_one_batch(monkeypatch, tmp_path):
+    batches = []
+
+    class FakeRustSyn:
+        @staticmethod
+        def parse_many(rust_codes, prune_unused=False):
+            batches.append(rust_codes)
+            return [
+                json.dumps({"items": [{"ident": rust_code.split()[1][:-2]}]}).encode()
+                for rust_code in rust_codes
+            ]
+
+    monkeypatch.setattr("utils.ast.load_rust_syn", lambda: FakeRustSyn)
+    rs_files = [tmp_path / "b.rs", tmp_path / "a.rs"]
+    rs_files[0].write_text("fn second() {}")
+    rs_files[1].write_text("\nfn first() {}")
+
+    file_asts = generate_ast_for_rust_files(rs_files, "program", "0.1.0")
+
+    assert len(batches) == 1
+    assert list(file_asts) == [str(rs_file) for rs_file in rs_files]
+    assert file_asts[str(rs_files[1])]["ast"][0]["src"]["line"] == 2
+    assert file_asts[str(rs_files[0])]["metadata"]["program_info"]["name"] == "program"
+
+
+def test_generate_ast_for_rust_files_parses_file_by_file_without_parse_many(
+    monkeypatch, tmp_path
+):
+    def fake_ast_json(rust_code):
+        return json.dumps({"items": [{"ident": rust_code.split()[1][:-2]}]})
+
+    class FakeRustSynWithJson:
+        @staticmethod
+        def parse_rust_to_json(rust_code, prune_unused=False):
+            return fake_ast_json(rust_code).encode()
+
+    class FakeRustSynWithAstOnly:
+        @staticmethod
+        def parse_rust_to_ast(rust_code):
+            return fake_ast_json(rust_code)
+
+    rs_files = [tmp_path / "b.rs", tmp_path / "a.rs"]
+    rs_files[0].write_text("fn second() {}")
+    rs_files[1].write_text("\nfn first() {}")
+
+    for fake_rust_syn in [FakeRustSynWithJson, FakeRustSynWithAstOnly]:
+        monkeypatch.setattr("utils.ast.load_rust_syn", lambda: fake_rust_syn)
+        file_asts = generate_ast_for_rust_files(rs_files)
+
+        assert list(file_asts) == [str(rs_file) for rs_file in rs_files]
+        assert [file_ast["ast"][0]["ident"] for file_ast in file_asts.values()] == [
+            "second",
+            "first",
+        ]
+        assert file_asts[str(rs_files[1])]["ast"][0]["src"]["line"] == 2
+
+
+def test_map_programs_keeps_program_order_with_worker_processes():
+    program_paths = [Path(f"programs/program-{index}") for index in range(5)]
+
+    assert map_programs(str, program_paths, workers=3) == [str(path) for path in program_paths]
+    assert map_programs(str, program_paths, workers=1) == [str(path) for path in program_paths]
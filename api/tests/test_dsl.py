@@ -1,5 +1,8 @@
 import pytest
-from utils.dsl.dsl import wrapped_exec
+from utils.dsl.ast_cache import ESTIMATED_BYTES_PER_NODE, ParsedASTCache, compute_ast_digest
+from utils.dsl.code_cache import CompiledCodeCache
+from utils.dsl.dsl import compile_rule, process_template_outputs, wrapped_exec
+from utils.dsl.dsl_ast_iterator import parse_ast
 
 malicious_payloads = [
     "() .__class__.__bases__[0].__subclasses__()[40](r'/etc/hosts').read()",
@@ -32,3 +35,191 @@ def test_wrapped_exec_benign_payloads(code):
     assert (
         wrapped_exec(code) is not None
     ), "Check that benign code executes without errors"
+
+
+def test_wrapped_exec_injected_globals():
+    outputs = wrapped_exec("print(len(ast))", {"ast": [1, 2, 3]})
+    assert outputs == ["3"]
+
+
+def test_wrapped_exec_globals_do_not_leak_between_runs():
+    wrapped_exec("leaked = 1", {"ast": []})
+    with pytest.raises(NameError):
+        wrapped_exec("print(leaked)")
+
+
+REPORT_AST = {
+    "items": [
+        {
+            "fn": {
+                "ident": "f",
+                "src": {"file": "lib.rs", "line": 1, "start_col": 1, "end_col": 2},
+                "block": {
+                    "stmts": [
+                        {
+                            "expr": {
+                                "ident": "x",
+                                "src": {"file": "lib.rs", "line": 2, "start_col": 5, "end_col": 6},
+                            }
+                        }
+                    ]
+                },
+            }
+        }
+    ]
+}
+REPORT_TEMPLATE = {"name": "n", "description": "d", "severity": "Low", "certainty": "Low"}
+
+
+def test_reported_nodes_are_located_like_printed_ones():
+    code = "for source, nodes in ast:\n    report(nodes.find_by_names('x', 'f'))"
+    printed_code = "for source, nodes in ast:\n    print(nodes.find_by_names('x', 'f').to_result())"
+
+    reported = []
+    outputs = wrapped_exec(code, {"ast": parse_ast(REPORT_AST).items()}, reported)
+    assert outputs == [] and [node.ident for node in reported] == ["f", "x"]
+    result = process_template_outputs(outputs, REPORT_TEMPLATE, reported)
+
+    printed = wrapped_exec(printed_code, {"ast": parse_ast(REPORT_AST).items()})
+    assert result == process_template_outputs(printed, REPORT_TEMPLATE)
+    assert result["locations"] == ["lib.rs:1:1-2", "lib.rs:2:5-6"]
+
+    # Without a list to record into, report() falls back to printing
+    fallback = wrapped_exec(code, {"ast": parse_ast(REPORT_AST).items()})
+    assert process_template_outputs(fallback, REPORT_TEMPLATE) == result
+
+    with pytest.raises(TypeError):
+        wrapped_exec("report('lib.rs:1')", reported=[])
+
+
+def test_template_changes_do_not_reach_the_next_template():
+    roots = parse_ast(REPORT_AST)
+    read_code = (
+        "for source, nodes in ast:\n"
+        "    print(len(nodes.find_by_names('x', 'f')))\n"
+        "    print(len(nodes.find_chained_calls('f').node_lists))"
+    )
+    assert wrapped_exec(read_code, {"ast": roots.items()}) == ["2", "1"]
+
+    # The lists handed out are copies of the cached results
+    wrapped_exec(
+        "for source, nodes in ast:\n"
+        "    nodes.find_by_names('x', 'f').nodes.clear()\n"
+        "    nodes.find_chained_calls('f').node_lists.append(1)",
+        {"ast": roots.items()},
+    )
+    assert wrapped_exec(read_code, {"ast": roots.items()}) == ["2", "1"]
+
+    for code in [
+        "for source, nodes in ast:\n    nodes.find_by_names('x').first().ident = 'y'",
+        "for source, nodes in ast:\n    del nodes.find_by_names('x').first().parent",
+        "for source, nodes in ast:\n    for nodes.ident in ['y']: pass",
+    ]:
+        with pytest.raises(RuntimeError):
+            compile_rule(code)
+
+    # Node data is read-only, so changing it in place fails when the rule runs
+    for statement, error in [
+        ("x.src.update({'line': 0})", AttributeError),
+        ("x.src['line'] = 0", TypeError),
+        ("f.children.clear()", AttributeError),
+        ("f.children.append(x)", AttributeError),
+        ("del f.children[0]", TypeError),
+        ("x.metadata.update({'mut': True})", AttributeError),
+    ]:
+        code = (
+            "for source, nodes in ast:\n"
+            "    f, x = nodes.find_by_names('f').first(), nodes.find_by_names('x').first()\n"
+            f"    {statement}"
+        )
+        with pytest.raises(error):
+            wrapped_exec(code, {"ast": roots.items()})
+
+    locate_code = "for source, nodes in ast:\n    report(nodes.find_by_names('x', 'f'))"
+    reported = []
+    outputs = wrapped_exec(locate_code, {"ast": roots.items()}, reported)
+    result = process_template_outputs(outputs, REPORT_TEMPLATE, reported)
+    assert result["locations"] == ["lib.rs:1:1-2", "lib.rs:2:5-6"]
+    assert [child.ident for child in roots["lib.rs"].find_by_names("f").first().children] == ["x"]
+    assert wrapped_exec(read_code, {"ast": roots.items()}) == ["2", "1"]
+
+    # Containers the rule creates, or gets back from to_result(), stay writable
+    outputs = wrapped_exec(
+        "def put(counts, key, value):\n"
+        "    counts[key] = value\n"
+        "seen = {'x': {}}\n"
+        "for source, nodes in ast:\n"
+        "    seen['x'][source] = len(nodes.find_by_names('x'))\n"
+        "    result = nodes.find_by_names('x').first().to_result()\n"
+        "    result['src']['line'] = 0\n"
+        "    put(seen, 'line', result['src']['line'])\n"
+        "print(seen)",
+        {"ast": roots.items()},
+    )
+    assert outputs == ['{"x": {"lib.rs": 1}, "line": 0}']
+    assert roots["lib.rs"].find_by_names("x").first().src["line"] == 2
+
+
+def test_parsed_ast_cache_hits_and_misses():
+    cache = ParsedASTCache(max_bytes=10 * ESTIMATED_BYTES_PER_NODE)
+    parse_calls = []
+
+    def parse():
+        parse_calls.append(1)
+        return parse_ast({"ident": "x", "src": {"file": "a.rs"}})
+
+    first = cache.get_or_parse((1, "digest", "rust"), parse)
+    second = cache.get_or_parse((1, "digest", "rust"), parse)
+
+    assert first is second
+    assert len(parse_calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_parsed_ast_cache_evicts_least_recently_used():
+    # Each parsed AST below holds a root and a single node
+    cache = ParsedASTCache(max_bytes=4 * ESTIMATED_BYTES_PER_NODE)
+
+    def parse():
+        return parse_ast({"ident": "x", "src": {"file": "a.rs"}})
+
+    cache.get_or_parse("a", parse)
+    cache.get_or_parse("b", parse)
+    cache.get_or_parse("a", parse)
+    cache.get_or_parse("c", parse)
+
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+    cache.get_or_parse("a", parse)
+    assert cache.stats()["hits"] == 2
+
+
+def test_compute_ast_digest_ignores_key_order():
+    assert compute_ast_digest({"a": 1, "b": [1, 2]}) == compute_ast_digest({"b": [1, 2], "a": 1})
+    assert compute_ast_digest({"a": 1}) != compute_ast_digest({"a": 2})
+    assert compute_ast_digest(None) is None
+
+
+def test_compiled_code_cache_hits_and_persists(tmp_path):
+    cache = CompiledCodeCache(directory=str(tmp_path))
+    first = cache.get_or_compile("print(1)", "policy", compile_rule)
+    second = cache.get_or_compile("print(1)", "policy", compile_rule)
+    assert first is second
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+    # A restarted worker loads the rule from disk, a new policy validates it again
+    restarted = CompiledCodeCache(directory=str(tmp_path))
+    restarted.get_or_compile("print(1)", "policy", compile_rule)
+    restarted.get_or_compile("print(1)", "new policy", compile_rule)
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["misses"] == 1
+
+
+def test_compiled_code_cache_does_not_cache_rejected_rules():
+    cache = CompiledCodeCache()
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.get_or_compile("open('/etc/hosts')", "policy", compile_rule)
+    assert cache.stats()["entries"] == 0
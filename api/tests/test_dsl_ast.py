@@ -0,0 +1,485 @@
+import json
+from pathlib import Path
+import pytest
+from utils.dsl.access_path import EMPTY_ACCESS_PATH
+from utils.dsl.ast_index import ASTIndex, iter_subtree
+from utils.dsl.dsl_ast_iterator import ASTNodeList, RustASTNode, parse_ast
+from utils.dsl.query_cache import (
+    QUERY_CACHE_BYTES_PER_NODE,
+    QUERY_CACHE_MAX_ENTRIES,
+    QUERY_RESULT_BYTES_PER_NODE,
+    estimate_result_bytes,
+)
+from utils.dsl.tracing import tracing
+
+AST_MOCK = Path("tests/mocks/ast_mock.json")
+
+
+def src(line):
+    return {"file": "lib.rs", "line": line, "start_col": 1, "end_col": 2}
+
+
+RUST_AST = {
+    "items": [
+        {
+            "fn": {
+                "ident": "first",
+                "src": src(1),
+                "block": {
+                    "stmts": [
+                        {"expr": {"ident": "amount", "src": src(2)}},
+                        {"expr": {"ident": "owner", "src": src(3), "mut": True}},
+                    ]
+                },
+            }
+        },
+        {
+            "fn": {
+                "ident": "second",
+                "src": src(4),
+                "block": {"stmts": [{"expr": {"ident": "amount", "src": src(5)}}]},
+            }
+        },
+    ]
+}
+
+def path_ident(ident, line):
+    return {"path": {"segments": [{"ident": ident, "src": src(line)}]}}
+
+
+def binary_fn(name, line, op, left, right):
+    expr = {
+        "binary": {
+            "left": path_ident(left, line + 1),
+            "op": op,
+            "right": path_ident(right, line + 1),
+        }
+    }
+    return {"fn": {"ident": name, "src": src(line), "block": {"stmts": [{"expr": expr}]}}}
+
+
+BINARY_AST = {
+    "items": [
+        binary_fn("scale", 1, "*", "price", "amount"),
+        binary_fn("split", 3, "/", "total", "parts"),
+    ]
+}
+
+SOLIDITY_AST = {
+    "sources": {
+        "C.sol": {
+            "ast": {
+                "nodeType": "SourceUnit",
+                "src": "0:100:0",
+                "nodes": [
+                    {
+                        "nodeType": "FunctionDefinition",
+                        "src": "1:10:0",
+                        "name": "deposit",
+                        "modifiers": [
+                            {
+                                "nodeType": "ModifierInvocation",
+                                "src": "2:5:0",
+                                "modifierName": {
+                                    "nodeType": "IdentifierPath",
+                                    "src": "2:5:0",
+                                    "name": "whenNotPaused",
+                                },
+                            }
+                        ],
+                    },
+                    {"nodeType": "FunctionDefinition", "src": "20:10:0", "name": "pause"},
+                ],
+            }
+        }
+    }
+}
+
+
+def test_find_by_names_is_limited_to_receiver_subtree():
+    root = parse_ast(RUST_AST)["lib.rs"]
+
+    assert [node.src["line"] for node in root.find_by_names("amount", "owner")] == [2, 3, 5]
+
+    second = root.find_functions_by_names("second").first()
+    assert [node.src["line"] for node in second.find_by_names("amount")] == [5]
+
+
+def test_find_all_functions_and_mutables():
+    root = parse_ast(RUST_AST)["lib.rs"]
+
+    assert [node.ident for node in root.find_all_functions()] == ["first", "second"]
+    assert [node.ident for node in root.find_mutables()] == ["owner"]
+
+
+def test_solidity_indexed_lookups():
+    root = parse_ast(SOLIDITY_AST, language="solidity")["C.sol"]
+
+    functions = root.find_all_functions()
+    assert [node.metadata["name"] for node in functions] == ["deposit", "pause"]
+    assert len(root.find_modifiers_by_names("whenNotPaused")) == 1
+    assert len(functions[1].find_modifiers_by_names("whenNotPaused")) == 0
+    assert len(root.find_nodes_by_types("ModifierInvocation", "SourceUnit")) == 2
+
+
+def test_indexed_lookups_match_full_walk_on_ast_mock():
+    with open(AST_MOCK, "r") as file:
+        roots = parse_ast(json.load(file))
+
+    for root in roots.values():
+        for function in root.find_all_functions():
+            subtree = list(iter_subtree(function))
+            for ident in ("ctx", "authority", "key"):
+                expected = [node for node in subtree if node.ident == ident]
+                assert list(function.find_by_names(ident)) == expected
+
+
+def test_subtree_numbering_matches_tree_shape():
+    root = parse_ast(RUST_AST)["lib.rs"]
+    index = root._index
+
+    for node in iter_subtree(root):
+        assert index.subtree(node) == list(iter_subtree(node))
+        for descendant in iter_subtree(node):
+            assert index.contains(node, descendant)
+
+    first, second = root.find_all_functions()
+    assert not index.contains(first, second)
+    assert not index.contains(second, first)
+
+
+def test_ident_summaries_never_miss_an_ident():
+    with open(AST_MOCK, "r") as file:
+        roots = parse_ast(json.load(file))
+
+    for root in roots.values():
+        index = root._index
+        idents = {node.ident for node in index.nodes} | {"is_signer", "missing"}
+        for node in index.nodes[:200]:
+            present = {sub_node.ident for sub_node in iter_subtree(node)}
+            for ident in idents:
+                assert index.contains_ident(node, ident) == (ident in present)
+                if ident in present:
+                    assert index.may_contain_ident(node, ident)
+
+
+def test_find_binary_operations_is_limited_to_receiver_subtree():
+    root = parse_ast(BINARY_AST)["lib.rs"]
+    scale, split = root.find_all_functions()
+
+    assert [node.ident for node in root.find_binary_operations("*", "/")] == ["*", "/"]
+    assert [node.ident for node in scale.find_binary_operations("*", "/")] == ["*"]
+    assert len(split.find_binary_operations("*")) == 0
+
+
+def test_enclosing_function_and_ancestors():
+    root = parse_ast(BINARY_AST)["lib.rs"]
+    amount = root.find_by_names("amount").first()
+
+    assert amount.find_enclosing_function().first().ident == "scale"
+    ancestors = amount.find_ancestors_by_names("scale", "*", "split")
+    assert [node.ident for node in ancestors] == ["scale", "*"]
+    assert len(root.find_enclosing_function()) == 0
+
+
+def test_solidity_enclosing_function_and_ancestors():
+    root = parse_ast(SOLIDITY_AST, language="solidity")["C.sol"]
+    modifier = root.find_nodes_by_types("IdentifierPath").first()
+
+    assert modifier.find_enclosing_function().first().metadata["name"] == "deposit"
+    ancestors = modifier.find_ancestors_by_types("SourceUnit", "FunctionDefinition")
+    assert [node.node_type for node in ancestors] == ["SourceUnit", "FunctionDefinition"]
+
+
+def test_find_methods_walk_deep_trees_without_recursion():
+    root = RustASTNode()
+    condition_path = EMPTY_ACCESS_PATH.key("cond").key("binary").key("left")
+    call_path = EMPTY_ACCESS_PATH.key("expr").key("call").key("args")
+    node = root
+    for line in range(5000):
+        path = condition_path if line % 100 == 0 else call_path
+        child = RustASTNode({"ident": f"v{line % 10}", "src": src(line)}, path)
+        node.add_child(child)
+        node = child
+    ASTIndex(root)
+
+    assert len(root.find_comparison_involving("v9")) == 50
+    assert len(root.find_comparison_involving("v42")) == 0
+    assert len(root.find_by_access_path("cond.binary")) == 50
+    assert len(root.find_negative_of_operation("find_comparisons_between", "v1", "v2")) == 5001
+    assert [node.ident for node in iter_subtree(root, prune=lambda node: node.ident == "v1")] == [
+        "root",
+        "v0",
+        "v1",
+    ]
+
+
+def test_parse_ast_handles_deeply_nested_expressions():
+    # a + b + ... as syn nests it, far deeper than the interpreter recursion limit
+    expr = path_ident("a0", 2)
+    for position in range(1, 1200):
+        expr = {"binary": {"left": expr, "op": "+", "right": path_ident(f"a{position}", 2)}}
+    ast = {"items": [{"fn": {"ident": "sum", "src": src(1), "block": {"stmts": [{"expr": expr}]}}}]}
+    root = parse_ast(ast)["lib.rs"]
+
+    assert len(root.find_binary_operations("+")) == 1199
+    assert root.find_by_names("a0").first().find_enclosing_function().first().ident == "sum"
+
+    solidity_expr = {"nodeType": "Identifier", "src": "0:1:0", "name": "x"}
+    for _ in range(3000):
+        solidity_expr = {"nodeType": "UnaryOperation", "src": "0:1:0", "subExpression": solidity_expr}
+    solidity_root = parse_ast({"sources": {"C.sol": {"ast": solidity_expr}}}, "solidity")["C.sol"]
+    assert len(solidity_root.find_nodes_by_types("UnaryOperation")) == 3000
+
+
+def test_nodes_are_slotted_and_do_not_share_metadata():
+    root = parse_ast(RUST_AST)["lib.rs"]
+    other_root = parse_ast(RUST_AST)["lib.rs"]
+
+    for node in iter_subtree(root):
+        assert not hasattr(node, "__dict__")
+
+    root.metadata = {"seen": True}
+    assert "seen" not in other_root.metadata
+    amount = root.find_by_names("amount").first()
+    assert amount.to_result()["metadata"] == {}
+    assert amount.children == ()
+
+    # Reads neither allocate nor hand out anything that changes the tree
+    assert amount._metadata is None
+    with pytest.raises(TypeError):
+        amount.metadata["seen"] = True
+    owner = root.find_mutables().first()
+    owner.to_result()["metadata"]["mut"] = False
+    assert owner.metadata == {"mut": True}
+
+
+def test_access_path_segments():
+    fn_path = EMPTY_ACCESS_PATH.key("items").index(3).key("fn")
+    left_path = fn_path.key("block").key("stmts").index(0).key("assign").key("left")
+
+    assert str(fn_path) == "items[3].fn"
+    assert str(left_path) == "items[3].fn.block.stmts[0].assign.left"
+    assert str(EMPTY_ACCESS_PATH.index(0).key("fn")) == "[0].fn"
+    assert fn_path.ends_with("fn") and not fn_path.ends_with("items")
+    assert left_path.contains("assign", "left") and not left_path.contains("left", "assign")
+    assert left_path.find("stmts") is left_path.ancestor(5)
+    assert left_path.starts_with(fn_path) and left_path.starts_with(fn_path, "block")
+    assert not left_path.starts_with(fn_path, "inputs")
+
+
+def test_nodes_share_access_path_prefixes():
+    root = parse_ast(RUST_AST)["lib.rs"]
+    first = root.find_functions_by_names("first").first()
+    amount, owner = first.find_by_names("amount", "owner")
+
+    assert first.access_path == "items[0].fn"
+    assert owner.access_path == "items[0].fn.block.stmts[1].expr"
+    assert amount._access_path.starts_with(first._access_path)
+    assert owner._access_path.ancestor(3) is first._access_path
+
+
+def test_mutable_node_shares_access_path_of_its_ident():
+    ast = {
+        "items": [
+            {
+                "fn": {
+                    "ident": "update",
+                    "src": src(1),
+                    "reference": {"mut": True, "expr": path_ident("state", 2)},
+                }
+            }
+        ]
+    }
+    root = parse_ast(ast)["lib.rs"]
+    mutable = root.find_mutables().first()
+
+    assert mutable.ident == "state"
+    assert mutable.access_path == "items[0].fn.reference.expr.path.segments[0]"
+
+
+def method_call(receiver, method, line):
+    return {"method_call": {"receiver": path_ident(receiver, line), "method": {"ident": method, "src": src(line)}}}
+
+
+def test_operands_are_matched_by_their_access_path_position():
+    compared = {"cond": {"binary": {"left": path_ident("a", 2), "op": "<", "right": method_call("b", "len", 2)}}}
+    assigned = {"assign": {"left": path_ident("x", 3), "right": method_call("y", "into", 3)}}
+    plain = {"assign": {"left": path_ident("x", 4), "right": path_ident("z", 4)}}
+    ast = {"items": [{"fn": {"ident": "run", "src": src(1), "block": {"stmts": [compared, assigned, plain]}}}]}
+    run = parse_ast(ast)["lib.rs"].find_all_functions().first()
+
+    # Each operand pairs with the last outermost node on the other side
+    pairs = run.find_comparisons_between("a", "b")
+    assert [[node.ident for node in pair] for pair in pairs] == [["a", "b"]]
+    assert len(run.find_comparisons_between("a", "len")) == 2
+    assert len(run.find_assignments("x", "y")) == 0
+    assert [[node.ident for node in pair] for pair in run.find_assignments("x", "into")] == [["x", "into"]]
+    assert [[node.src["line"] for node in pair] for pair in run.find_assignments("x", "z")] == [[4, 4]]
+
+
+def test_member_accesses_include_call_and_method_call_arguments():
+    accessed = {"field": {"base": path_ident("ctx", 2), "member": "accounts"}}
+    pushed = {"method_call": {**method_call("v", "push", 2)["method_call"], "args": [accessed]}}
+    called = {"call": {"func": path_ident("check", 3), "args": [path_ident("ctx", 3)]}}
+    ignored = {"expr": path_ident("ctx", 4)}
+    ast = {"items": [{"fn": {"ident": "run", "src": src(1), "block": {"stmts": [pushed, called, ignored]}}}]}
+    root = parse_ast(ast)["lib.rs"]
+
+    accesses = root.find_member_accesses("ctx")
+    assert [node.src["line"] for node in accesses] == [2, 3]
+    assert accesses[0].access_path.endswith("method_call.args[0].field.base.path.segments[0]")
+
+
+def test_nodes_are_linked_to_the_closest_enclosing_node_of_their_source():
+    other = {"ident": "other", "src": {**src(2), "file": "other.rs"}, "expr": path_ident("inner", 3)}
+    expr = {"binary": {"left": {"reference": {"mut": True, "expr": path_ident("x", 4)}}, "op": "+"}}
+    ast = {"items": [{"fn": {"ident": "run", "src": src(1), "block": [other, expr]}}]}
+    roots = parse_ast(ast)
+
+    run = roots["lib.rs"].children[0]
+    assert [child.ident for child in run.children] == ["inner", "+"]
+    assert list(roots) == ["lib.rs", "other.rs"]
+    binary = run.children[1]
+    assert [(child.ident, child.metadata) for child in binary.children] == [("x", {"mut": True})]
+    assert binary.children[0].access_path == "items[0].fn.block[1].binary.left.reference.expr.path.segments[0]"
+
+
+def test_columnar_lookups_match_object_lookups():
+    pytest.importorskip("numpy")
+    with open(AST_MOCK, "r") as file:
+        data = json.load(file)
+    roots = parse_ast(data)
+    columnar_roots = parse_ast(data, columnar=True)
+
+    for source, root in roots.items():
+        columnar_root = columnar_roots[source]
+        assert columnar_root._index.columns is not None
+        for function, columnar_function in zip(
+            root.find_all_functions(), columnar_root.find_all_functions()
+        ):
+            for ident in ("ctx", "authority", "key"):
+                expected = [node.src for node in function.find_by_names(ident)]
+                found = columnar_function.find_by_names(ident)
+                assert [node.src for node in found] == expected
+        expected = [node.src for node in root.find_mutables()]
+        assert [node.src for node in columnar_root.find_mutables()] == expected
+
+
+def test_columnar_node_lists_materialize_lazily():
+    pytest.importorskip("numpy")
+    root = parse_ast(RUST_AST, columnar=True)["lib.rs"]
+    columns = root._index.columns
+
+    amounts = root.find_by_names("amount")
+    assert amounts._nodes is None
+    assert len(amounts) == 2 and amounts.first().src["line"] == 2
+    assert amounts._nodes is None
+    assert [node["src"]["line"] for node in amounts.to_result()] == [2, 5]
+
+    owner = root.find_by_names("owner").first()
+    assert columns.depth[owner._enter] == 2
+    assert columns.parent[owner._enter] == owner.parent._enter
+    assert columns.line[owner._enter] == 3
+
+    solidity_root = parse_ast(SOLIDITY_AST, language="solidity", columnar=True)["C.sol"]
+    modifiers = solidity_root.find_nodes_by_types("ModifierInvocation")
+    assert [node.node_type for node in modifiers] == ["ModifierInvocation"]
+
+
+def test_query_results_are_cached_per_tree():
+    roots = parse_ast(RUST_AST)
+    root = roots["lib.rs"]
+    cache = root._index.query_cache
+
+    amounts = root.find_by_names("amount")
+    assert root.find_by_names("amount") is amounts
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # Receiver, method and argument types are part of the key
+    function = root.find_all_functions().first()
+    assert len(function.find_by_names("amount")) == 1
+    assert len(root.find_by_names("amount", "owner")) == 3
+    assert cache.stats()["hits"] == 1
+
+    cache.max_entries = 1
+    root.find_by_names("owner")
+    assert cache.stats()["entries"] == 1 and cache.stats()["evictions"] > 0
+    assert parse_ast(RUST_AST)["lib.rs"]._index.query_cache.stats()["misses"] == 0
+
+
+def test_query_cache_is_bounded_by_the_size_of_its_tree():
+    with open(AST_MOCK, "r") as file:
+        roots = parse_ast(json.load(file))
+    root = max(roots.values(), key=lambda root: root._index.size)
+    cache = root._index.query_cache
+    assert cache.max_bytes == root._index.size * QUERY_CACHE_BYTES_PER_NODE
+
+    for function in root.find_all_functions():
+        for node in iter_subtree(function):
+            node.find_by_names("ctx")
+            node.find_chained_calls()
+    stats = cache.stats()
+    assert stats["evictions"] > 0 and 0 < stats["bytes"] <= cache.max_bytes
+    assert stats["entries"] < QUERY_CACHE_MAX_ENTRIES
+
+    # A result is charged for the nodes it holds
+    everything = root.find_by_access_path("")
+    assert estimate_result_bytes(everything) - estimate_result_bytes(ASTNodeList([])) == (
+        root._index.size * QUERY_RESULT_BYTES_PER_NODE
+    )
+
+
+def test_lazy_node_list_chains_match_eager_chains():
+    root = parse_ast(RUST_AST)["lib.rs"]
+    lazy_root = parse_ast(RUST_AST, lazy=True)["lib.rs"]
+
+    chain = lazy_root.find_all_functions().find_by_names("amount", "owner")
+    assert chain._plan is not None
+    assert chain.first().src["line"] == 2
+    assert chain._plan is not None
+
+    expected = [node.src for node in root.find_all_functions().find_by_names("amount", "owner")]
+    assert [node.src for node in chain] == expected
+    assert chain._plan is None and len(chain) == len(expected)
+
+    missing = lazy_root.find_all_functions().find_by_names("missing")
+    assert missing.exit_on_value() is missing and len(missing) == 0
+
+
+def test_tracing_records_dsl_calls_only_while_enabled():
+    root = parse_ast(RUST_AST)["lib.rs"]
+    bare = RustASTNode.find_by_names
+
+    with tracing() as trace:
+        root.find_by_names("amount")
+        with pytest.raises(StopIteration):
+            root.find_by_names("missing").exit_on_none()
+    with tracing(False) as disabled:
+        root.find_by_names("owner")
+
+    assert RustASTNode.find_by_names is bare and disabled is None
+    assert [(event["function"], event["args"], event["nodes"]) for event in trace.events] == [
+        ("RustASTNode.find_by_names", ["amount"], 2),
+        ("RustASTNode.find_by_names", ["missing"], 0),
+        ("ASTNodeList.exit_on_none", [], 0),
+    ]
+    assert trace.events[-1]["exit"] == "StopIteration: No nodes found"
+    assert all(event["elapsed_ms"] >= 0 for event in trace.events)
+
+
+def test_results_include_children_only_on_request():
+    function = parse_ast(RUST_AST)["lib.rs"].find_all_functions().first()
+
+    result = function.to_result()
+    assert "children" not in result
+    assert result["ident"] == "first" and result["src"]["line"] == 1
+
+    child = function.to_result(1)["children"][0]
+    assert "children" not in child
+
+    def result_size(result):
+        return 1 + sum(map(result_size, result.get("children", [])))
+
+    assert result_size(function.to_result(None)) == len(list(iter_subtree(function)))
+    assert result_size(function.to_result(1)) == 1 + len(function.children)
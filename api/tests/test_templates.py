@@ -3,7 +3,8 @@ from pathlib import Path
 import pytest
 import yaml
 from utils.ast import generate_ast_for_rust_file
-from utils.dsl.dsl import inject_code_lines, process_template_outputs, wrapped_exec
+from utils.dsl.dsl import process_template_outputs, wrapped_exec
+from utils.dsl.dsl_ast_iterator import parse_ast
 
 
 def normalize_template_name(name):
@@ -317,9 +318,10 @@ def run_template_on_ast(yaml_data, ast_file, language: str = "rust"):
     with open(ast_file, "r") as file:
         ast_data = json.load(file)
     
-    modified_code = inject_code_lines(code, [f"ast = parse_ast({ast_data}, language={repr(language)}).items()"])
-    template_outputs = wrapped_exec(modified_code)
-    result = process_template_outputs(template_outputs, yaml_data)
+    ast = parse_ast(ast_data, language=language).items()
+    reported = []
+    template_outputs = wrapped_exec(code, {"ast": ast}, reported)
+    result = process_template_outputs(template_outputs, yaml_data, reported)
     
     return result
 
@@ -327,9 +329,10 @@ def run_template_on_ast(yaml_data, ast_file, language: str = "rust"):
 def run_template_on_rust_source(yaml_data, source_file: Path):
     code = yaml_data["rule"]
     ast_data = generate_ast_for_rust_file(source_file)["ast"]
-    modified_code = inject_code_lines(code, [f"ast = parse_ast({ast_data}, language='rust').items()"])
-    template_outputs = wrapped_exec(modified_code)
-    return process_template_outputs(template_outputs, yaml_data)
+    ast = parse_ast(ast_data, language="rust").items()
+    reported = []
+    template_outputs = wrapped_exec(code, {"ast": ast}, reported)
+    return process_template_outputs(template_outputs, yaml_data, reported)
 
 
 @pytest.mark.parametrize("template_data", get_template_test_data(), ids=lambda x: x["template_name"])
@@ -492,3 +495,27 @@ def test_runtime_rust_template_accuracy(template_data):
 
     assert bad_locations == set(template_data["expected_bad_locations"])
     assert good_locations == []
+
+
+AST_MOCK = Path("tests/mocks/ast_mock.json")
+AST_MOCK_FINDINGS = Path("tests/mocks/ast_mock_findings.json")
+
+
+def test_rust_templates_on_ast_mock_match_recorded_findings():
+    """Guards DSL internals: every rust template must keep its recorded findings on the anchor AST mock."""
+    with open(AST_MOCK_FINDINGS, "r") as file:
+        expected_findings = json.load(file)
+
+    mismatches = []
+    for yaml_file in sorted(Path("builtin_templates").glob("*.yaml")):
+        with open(yaml_file, "r") as file:
+            yaml_data = yaml.safe_load(file)
+        if yaml_data.get("language", "rust") != "rust":
+            continue
+
+        result = run_template_on_ast(yaml_data, AST_MOCK)
+        locations = sorted(result.get("locations", []))
+        if locations != expected_findings.get(yaml_data["name"]):
+            mismatches.append(f"{yaml_data['name']}: {locations}")
+
+    assert not mismatches, "Findings changed:\n" + "\n".join(mismatches)
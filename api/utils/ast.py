@@ -1,8 +1,10 @@
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 import json
 from pathlib import Path
 import sys
 import re
-from typing import Any
+from typing import Any, Optional
 
 
 import logging
@@ -39,21 +41,55 @@ def parse_toml_keys(toml_path: Path, keys: list) -> list:
     return results
 
 
+def load_rust_syn():
+    # Ensure proper import of rust_syn.so (copied at build time)
+    path_to_rust_syn_so = "/api/utils"
+    if path_to_rust_syn_so not in sys.path:
+        sys.path.append(path_to_rust_syn_so)
+    import rust_syn  # type: ignore
+
+    return rust_syn
+
+
 def generate_ast_for_rust_file(
     source_file_path: Path, package_name: str = None, package_version: str = None
 ) -> dict:
-    rust_code = source_file_path.read_text()
+    return generate_ast_for_rust_files([source_file_path], package_name, package_version)[
+        str(source_file_path)
+    ]
 
-    try:
-        # Ensure proper import of rust_syn.so (copied at build time)
-        path_to_rust_syn_so = "/api/utils"
-        if path_to_rust_syn_so not in sys.path:
-            sys.path.append(path_to_rust_syn_so)
-        import rust_syn  # type: ignore
 
-        ast_data = rust_syn.parse_rust_to_ast(rust_code)
-        ast_data = json.loads(ast_data)
+def parse_rust_codes(rust_syn, rust_codes: list) -> list:
+    """Parse Rust sources into their syn AST JSON, in the given order.
+
+    The sources are parsed together by rust_syn.parse_many, in parallel and without holding the
+    GIL. rust_syn.so is built separately from the Python code, so with a build that predates
+    parse_many they are parsed one by one with parse_rust_to_json, or parse_rust_to_ast.
+    """
+    # Compact JSON bytes. prune_unused stays off until the pruning pass has run against a built
+    # extension (cargo test in rust_syn_wrapper)
+    if hasattr(rust_syn, "parse_many"):
+        return rust_syn.parse_many(rust_codes)
+    if hasattr(rust_syn, "parse_rust_to_json"):
+        return [rust_syn.parse_rust_to_json(rust_code) for rust_code in rust_codes]
+    return [rust_syn.parse_rust_to_ast(rust_code) for rust_code in rust_codes]
+
 
+def generate_ast_for_rust_files(
+    source_file_paths: list, package_name: str = None, package_version: str = None
+) -> dict:
+    """Generate the ASTs of many Rust files of a package, see parse_rust_codes.
+
+    Returns:
+        Dictionary mapping each file path (as a string) to its AST, in the given order.
+    """
+    rust_syn = load_rust_syn()
+    rust_codes = [source_file_path.read_text() for source_file_path in source_file_paths]
+    ast_jsons = parse_rust_codes(rust_syn, rust_codes)
+
+    file_asts = {}
+    for source_file_path, rust_code, ast_json in zip(source_file_paths, rust_codes, ast_jsons):
+        ast_data = json.loads(ast_json)
         enriched_ast = enrich_ast_with_source_lines(
             ast_data.get("items"), rust_code, source_file_path
         )
@@ -65,67 +101,68 @@ def generate_ast_for_rust_file(
                 "version": package_version,
             }
 
-    except Exception as e:
-        raise e
-
-    return {"ast": enriched_ast, "metadata": source_sepcific_metadata}
+        file_asts[str(source_file_path)] = {
+            "ast": enriched_ast,
+            "metadata": source_sepcific_metadata,
+        }
+    return file_asts
 
 
 def enrich_ast_with_source_lines(
     ast_items: dict, rust_code: str, source_file_path: Path
 ) -> dict:
-    def find_ident_positions(code: str, ident: str) -> list[dict]:
-        positions = []
-        pattern = re.compile(r"\b" + re.escape(ident) + r"\b")
-        for match in pattern.finditer(code):
-            start_pos = match.start()
-            line_num = code.count("\n", 0, start_pos) + 1
-            line_start = code.rfind("\n", 0, start_pos) + 1
-            end_pos = match.end()
-            start_col = start_pos - line_start + 1
-            end_col = end_pos - line_start + 1
-            positions.append(
-                {
-                    "file": str(source_file_path),
-                    "line": line_num,
-                    "start_col": start_col,
-                    "end_col": end_col,
-                }
-            )
-        return positions
+    # Offset of the first character of every line, so a match offset resolves to its line by
+    # binary search instead of rescanning the code before it
+    line_starts = [0] + [match.end() for match in re.finditer("\n", rust_code)]
+
+    # One pass maps every word of the code to the (start, end) offsets of its first occurrence,
+    # the maximal run a `\bident\b` search would find first
+    first_occurrences = {}
+    for match in re.finditer(r"\w+", rust_code):
+        first_occurrences.setdefault(match.group(), match.span())
+
+    def find_first_occurrence(ident: str) -> Optional[tuple[int, int]]:
+        if ident not in first_occurrences:
+            if re.fullmatch(r"\w+", ident):
+                return None
+            # Idents that are not a single word (e.g. raw identifiers) are searched for directly
+            match = re.search(r"\b" + re.escape(ident) + r"\b", rust_code)
+            first_occurrences[ident] = match.span() if match else None
+        return first_occurrences[ident]
+
+    def to_position(start_pos: int, end_pos: int) -> dict:
+        line_num = bisect_right(line_starts, start_pos)
+        line_start = line_starts[line_num - 1]
+        return {
+            "file": str(source_file_path),
+            "line": line_num,
+            "start_col": start_pos - line_start + 1,
+            "end_col": end_pos - line_start + 1,
+        }
 
-    def enrich_node(node: Any, scanned_idents: dict[str, list[dict]]) -> None:
+    def enrich_node(node: Any) -> None:
         if isinstance(node, dict):
             items = list(node.items())
             for key, value in items:
                 if isinstance(value, dict):
-                    enrich_node(value, scanned_idents)
+                    enrich_node(value)
                 elif isinstance(value, list):
                     for item in value:
-                        enrich_node(item, scanned_idents)
+                        enrich_node(item)
                 elif key in ("ident", "method", "int"):
-                    ident = value
-                    if key == "method":
+                    ident = str(value) if key == "int" else value
+                    if key in ("method", "int"):
                         node["ident"] = ident
-                    if key == "int":
-                        node["ident"] = str(node["int"])
-                    if ident not in scanned_idents:
-                        positions = find_ident_positions(rust_code, ident)
-                        if positions:
-                            node["src"] = positions[0]
-                            scanned_idents[ident] = positions
-                    else:
-                        for pos in scanned_idents[ident]:
-                            if pos not in node.get("src", []):
-                                node["src"] = pos
-                                break
-                    
+                    # Every node of an ident takes its first occurrence in the source
+                    occurrence = find_first_occurrence(ident)
+                    if occurrence:
+                        node["src"] = to_position(*occurrence)
+
         elif isinstance(node, list):
             for item in node:
-                enrich_node(item, scanned_idents)
+                enrich_node(item)
 
-    scanned_idents = {}
-    enrich_node(ast_items, scanned_idents)
+    enrich_node(ast_items)
     return ast_items
 
 
@@ -149,6 +186,27 @@ def find_anchor_program_paths(source_file_path, workspace_members):
     return program_paths
 
 
+def map_programs(generate_program_ast, program_paths: list, workers: int = 1) -> list:
+    """Generate the ASTs of many programs, on a pool of worker processes when workers > 1.
+
+    Each program is parsed and enriched entirely within a worker. The results are returned in
+    the order of program_paths, so merging them is deterministic.
+
+    Args:
+        generate_program_ast: Module level function generating the AST of one program path.
+        program_paths: Program directories.
+        workers: Maximum number of worker processes.
+
+    Returns:
+        List of program ASTs.
+    """
+    workers = min(workers, len(program_paths))
+    if workers <= 1:
+        return [generate_program_ast(program_path) for program_path in program_paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(generate_program_ast, program_paths))
+
+
 def generate_ast_for_rust_program(source_file_path: Path) -> dict:
     cargo_toml_path = source_file_path / "Cargo.toml"
     package_name, package_version = parse_toml_keys(
@@ -157,10 +215,10 @@ def generate_ast_for_rust_program(source_file_path: Path) -> dict:
     directory = cargo_toml_path.parent
     rs_files = list(directory.rglob("*.rs"))
 
-    radar_ast = {"sources": {}, "metadata": {}}
-    for rs_file in rs_files:
-        file_ast = generate_ast_for_rust_file(rs_file, package_name, package_version)
-        radar_ast["sources"][str(rs_file)] = file_ast
+    radar_ast = {
+        "sources": generate_ast_for_rust_files(rs_files, package_name, package_version),
+        "metadata": {},
+    }
 
     sorted_sources = dict(sorted(radar_ast["sources"].items()))
     radar_ast["sources"] = sorted_sources
@@ -175,11 +233,11 @@ def generate_anchor_project_derived_program_ast(program_path: Path) -> dict:
     )
     rs_files = list(program_path.rglob("*.rs"))
 
-    program_ast = {"sources": {}, "metadata": {}}
-
+    program_ast = {
+        "sources": generate_ast_for_rust_files(rs_files, package_name, package_version),
+        "metadata": {},
+    }
     for rs_file in rs_files:
-        file_ast = generate_ast_for_rust_file(rs_file, package_name, package_version)
-        program_ast["sources"][str(rs_file)] = file_ast
         program_ast["metadata"][str(rs_file)] = {
             "package_name": package_name,
             "package_version": package_version,
@@ -189,7 +247,7 @@ def generate_anchor_project_derived_program_ast(program_path: Path) -> dict:
     return program_ast
 
 
-def generate_ast_for_anchor_project(source_path: Path) -> dict:
+def generate_ast_for_anchor_project(source_path: Path, workers: int = 1) -> dict:
     anchor_toml_path = source_path / "Anchor.toml"
     anchor_version, solana_version = parse_toml_keys(
         anchor_toml_path, ["anchor_version", "solana_version"]
@@ -216,8 +274,9 @@ def generate_ast_for_anchor_project(source_path: Path) -> dict:
         "sources": {},
     }
 
-    for program_path in programs:
-        program_ast = generate_anchor_project_derived_program_ast(program_path)
+    for program_ast in map_programs(
+        generate_anchor_project_derived_program_ast, programs, workers
+    ):
         project_ast["sources"].update(program_ast["sources"])
 
     sorted_sources = dict(sorted(project_ast["sources"].items()))
@@ -226,26 +285,26 @@ def generate_ast_for_anchor_project(source_path: Path) -> dict:
     return project_ast
 
 
-def generate_aggregate_program_ast(base_path: Path) -> dict | None:
+def generate_aggregate_program_ast(base_path: Path, workers: int = 1) -> dict | None:
     project_ast = {"sources": {}, "metadata": {}}
-    found_cargo_toml = False
+    program_paths = []
 
     def process_directory(directory):
-        nonlocal found_cargo_toml
         for subdir in directory.iterdir():
             if subdir.is_dir():
                 if (subdir / "Cargo.toml").exists():
-                    found_cargo_toml = True
-                    program_ast = generate_ast_for_rust_program(subdir)
-                    for file_path, ast in program_ast["sources"].items():
-                        project_ast["sources"][file_path] = ast
+                    program_paths.append(subdir)
                 process_directory(subdir)
 
     process_directory(base_path)
 
-    if not found_cargo_toml:
+    if not program_paths:
         return None
 
+    for program_ast in map_programs(generate_ast_for_rust_program, program_paths, workers):
+        for file_path, ast in program_ast["sources"].items():
+            project_ast["sources"][file_path] = ast
+
     sorted_sources = dict(sorted(project_ast["sources"].items()))
     project_ast["sources"] = sorted_sources
 
@@ -0,0 +1,128 @@
+from typing import Optional
+
+# Access path keys are interned to small ints shared by every parsed tree of the process,
+# list indexes are stored inline as negative ints (~index)
+_segment_ids = {}
+_segment_names = []
+
+
+def segment_id(key: str) -> int:
+    """Return the interned id of an access path key, interning it on first use."""
+    segment = _segment_ids.get(key)
+    if segment is None:
+        segment = len(_segment_names)
+        _segment_ids[key] = segment
+        _segment_names.append(key)
+    return segment
+
+
+def segment_ids(keys) -> Optional[tuple]:
+    """Return the ids of already interned keys, or None if one was never seen (so cannot match)."""
+    segments = tuple(_segment_ids.get(key) for key in keys)
+    return None if None in segments else segments
+
+
+class AccessPath:
+    """An access path stored as one segment linked to the path of its parent container.
+
+    Serializers create one path object per position of the AST and share it with every node at
+    that position and with the paths below it, so within one parsed tree equal paths are the same
+    object and a prefix of a path is always one of its ancestors. The dotted string form
+    (e.g. "items[3].fn.block") is only produced on demand. EMPTY_ACCESS_PATH is the empty path
+    every other path descends from.
+    """
+
+    __slots__ = ("parent", "segment", "depth")
+
+    def __init__(self, parent: Optional["AccessPath"] = None, segment: Optional[int] = None):
+        self.parent = parent
+        self.segment = segment
+        self.depth = parent.depth + 1 if parent is not None else 0
+
+    def key(self, key: str) -> "AccessPath":
+        segment = _segment_ids.get(key)
+        if segment is None:
+            segment = segment_id(key)
+        return AccessPath(self, segment)
+
+    def index(self, index: int) -> "AccessPath":
+        return AccessPath(self, ~index)
+
+    def segments(self) -> tuple:
+        """Return the segment ids from the outermost to the innermost one."""
+        segments = [None] * self.depth
+        path = self
+        while path.depth:
+            segments[path.depth - 1] = path.segment
+            path = path.parent
+        return tuple(segments)
+
+    def ancestor(self, depth: int) -> "AccessPath":
+        """Return the prefix of this path holding the given number of segments."""
+        path = self
+        while path.depth > depth:
+            path = path.parent
+        return path
+
+    def starts_with(self, prefix: "AccessPath", *keys: str) -> bool:
+        """Check whether this path begins with a prefix path, optionally followed by keys."""
+        depth = prefix.depth + len(keys)
+        if self.depth < depth:
+            return False
+        path = self.ancestor(depth)
+        return path.ends_with(*keys) and path.ancestor(prefix.depth) is prefix
+
+    def ends_with(self, *keys: str) -> bool:
+        path = self
+        for key in reversed(keys):
+            if not path.depth or path.segment != _segment_ids.get(key):
+                return False
+            path = path.parent
+        return True
+
+    def find(self, *keys: str) -> Optional["AccessPath"]:
+        """Find the first run of consecutive keys in this path.
+
+        Returns:
+            The prefix of this path ending with the run, or None.
+        """
+        positions = self._find_positions(keys)
+        return self.ancestor(positions[0] + len(keys)) if positions else None
+
+    def rfind(self, *keys: str) -> Optional["AccessPath"]:
+        """Find the last run of consecutive keys in this path, see find."""
+        positions = self._find_positions(keys)
+        return self.ancestor(positions[-1] + len(keys)) if positions else None
+
+    def contains(self, *keys: str) -> bool:
+        return bool(self._find_positions(keys, first_only=True))
+
+    def _find_positions(self, keys, first_only=False) -> list:
+        run = segment_ids(keys)
+        if not run:
+            return []
+        segments = self.segments()
+        positions = []
+        for position in range(len(segments) - len(run) + 1):
+            if segments[position : position + len(run)] == run:
+                positions.append(position)
+                if first_only:
+                    break
+        return positions
+
+    def __str__(self):
+        parts = []
+        for segment in self.segments():
+            if segment < 0:
+                parts.append(f"[{~segment}]")
+            elif parts:
+                parts.append("." + _segment_names[segment])
+            else:
+                parts.append(_segment_names[segment])
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"AccessPath({str(self)!r})"
+
+
+EMPTY_ACCESS_PATH = AccessPath()
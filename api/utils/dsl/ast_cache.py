@@ -0,0 +1,133 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import threading
+from typing import Callable, Hashable
+from utils.dsl.query_cache import QUERY_CACHE_BYTES_PER_NODE
+
+logger = logging.getLogger(__name__)
+
+# Rough in-memory footprint of a parsed node (object, metadata, access path, index entries),
+# measured with tracemalloc on parsed mock ASTs (see docs/Technical-Decisions.md)
+PARSED_BYTES_PER_NODE = 640
+
+# Index structures built on first use: the ident Bloom summaries (~42 bytes per node) and the
+# operand groups by path prefix (~14 bytes per node for "left" and "right")
+INDEX_EXTRA_BYTES_PER_NODE = 64
+
+# Upper bound of what a cached tree holds per node once templates have run on it, query cache
+# included since it is capped relative to the size of its tree
+ESTIMATED_BYTES_PER_NODE = (
+    PARSED_BYTES_PER_NODE + INDEX_EXTRA_BYTES_PER_NODE + QUERY_CACHE_BYTES_PER_NODE
+)
+
+
+def compute_ast_digest(ast) -> str | None:
+    """Compute a stable content hash for a generated AST.
+
+    Args:
+        ast: The AST dictionary as stored on GeneratedAST.
+
+    Returns:
+        Hex encoded sha256 of the canonical JSON form, or None when there is no AST.
+    """
+    if ast is None:
+        return None
+    canonical = json.dumps(ast, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def estimate_parsed_ast_bytes(roots: dict) -> int:
+    """Estimate the memory held by parsed source roots.
+
+    Args:
+        roots: Dictionary mapping source names to root nodes, as returned by parse_ast.
+
+    Returns:
+        Estimated size in bytes once fully used, based on the number of reachable nodes.
+    """
+    node_count = 0
+    stack = list(roots.values())
+    while stack:
+        node = stack.pop()
+        node_count += 1
+        stack.extend(node.children)
+    return node_count * ESTIMATED_BYTES_PER_NODE
+
+
+class ParsedASTCache:
+    """Process-local LRU cache of parsed AST roots bounded by an estimated memory budget.
+
+    Every template of a scan runs on the same GeneratedAST, so a worker process only has to
+    decode and parse it once. Entries are keyed by the caller (typically AST id, content digest
+    and language) and the least recently used entries are evicted once the budget is exceeded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_parse(self, key: Hashable, parse: Callable[[], dict]) -> dict:
+        """Return cached parsed roots for a key, parsing and caching them on a miss.
+
+        Args:
+            key: Cache key identifying the AST content and parse options.
+            parse: Callable producing the parsed roots on a miss.
+
+        Returns:
+            Dictionary mapping source names to root nodes.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        roots = parse()
+        size = estimate_parsed_ast_bytes(roots)
+
+        with self._lock:
+            if size > self.max_bytes:
+                logger.info(
+                    f"Parsed AST {key} ({size} bytes) exceeds cache budget of {self.max_bytes} bytes, not caching"
+                )
+                return roots
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (roots, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self.evictions += 1
+                logger.info(f"Evicted parsed AST {evicted_key} from cache")
+        return roots
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """Return cache counters.
+
+        Returns:
+            Dictionary with hits, misses, evictions, entry count and estimated bytes held.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
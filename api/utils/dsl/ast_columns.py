@@ -0,0 +1,106 @@
+from typing import Callable, Mapping
+
+try:
+    import numpy as np
+except ImportError as exc:
+    raise ImportError(
+        "RADAR_COLUMNAR_AST requires NumPy, an optional dependency of the API. "
+        "Install the columnar extra (poetry install --extras columnar) or unset the flag."
+    ) from exc
+
+# Value of an id or src column when the node has no such value
+MISSING = -1
+
+
+def src_position(src: dict, key: str) -> int:
+    value = src.get(key)
+    return value if isinstance(value, int) else MISSING
+
+
+class ASTColumns:
+    """Struct-of-arrays view of one indexed tree, for vectorized predicates.
+
+    Row i describes the node with enter ordinal i (ASTIndex.nodes[i]), so the subtree of a node
+    is the row range [node._enter, node._exit) and query results are arrays of ordinals that
+    only need to be turned into node objects once they are used.
+
+    Columns:
+        parent: Ordinal of the parent node, MISSING for the root.
+        depth: Distance from the root.
+        ident: Interned ident id (Rust).
+        node_type: Interned nodeType id (Solidity).
+        exit: Exit ordinal, one past the last descendant.
+        line, start_col, end_col: Source location of Rust nodes.
+        mut: Whether the node is flagged as mutable.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.vocabulary = {}
+
+        parent, depth, ident, node_type, exits = [], [], [], [], []
+        line, start_col, end_col, mut = [], [], [], []
+        for node in index.nodes:
+            if node.parent is not None and node.parent._index is index:
+                parent.append(node.parent._enter)
+                depth.append(depth[node.parent._enter] + 1)
+            else:
+                parent.append(MISSING)
+                depth.append(0)
+            ident.append(self._intern(getattr(node, "ident", None)))
+            node_type.append(self._intern(getattr(node, "node_type", None)))
+            exits.append(node._exit)
+            src = node.src if isinstance(node.src, Mapping) else {}
+            line.append(src_position(src, "line"))
+            start_col.append(src_position(src, "start_col"))
+            end_col.append(src_position(src, "end_col"))
+            mut.append(node._metadata is not None and node._metadata.get("mut") is True)
+
+        self.parent = np.array(parent, dtype=np.int32)
+        self.depth = np.array(depth, dtype=np.int32)
+        self.ident = np.array(ident, dtype=np.int32)
+        self.node_type = np.array(node_type, dtype=np.int32)
+        self.exit = np.array(exits, dtype=np.int32)
+        self.line = np.array(line, dtype=np.int32)
+        self.start_col = np.array(start_col, dtype=np.int32)
+        self.end_col = np.array(end_col, dtype=np.int32)
+        self.mut = np.array(mut, dtype=bool)
+
+    def _intern(self, value) -> int:
+        if not isinstance(value, str):
+            return MISSING
+        return self.vocabulary.setdefault(value, len(self.vocabulary))
+
+    def ids(self, values) -> np.ndarray:
+        """Return the interned ids of the values that occur in this tree."""
+        return np.array(
+            [
+                self.vocabulary[value]
+                for value in values
+                if isinstance(value, str) and value in self.vocabulary
+            ],
+            dtype=np.int32,
+        )
+
+    def select(self, mask: Callable[[slice], np.ndarray], within) -> np.ndarray:
+        """Return the ordinals of the subtree of within for which a row mask is set.
+
+        Args:
+            mask: Callable turning a slice of rows into a boolean array over these rows.
+            within: Node whose subtree limits the results.
+
+        Returns:
+            Sorted array of matching ordinals.
+        """
+        start, end = within._enter, within._exit
+        return np.flatnonzero(mask(slice(start, end))) + start
+
+    def find_in(self, column: np.ndarray, values, within) -> np.ndarray:
+        """Return the ordinals of the nodes of a subtree whose interned column value is in values."""
+        ids = self.ids(values)
+        if not len(ids):
+            return np.empty(0, dtype=np.int64)
+        return self.select(lambda rows: np.isin(column[rows], ids), within)
+
+    def find_mutables(self, within) -> np.ndarray:
+        return self.select(lambda rows: self.mut[rows], within)
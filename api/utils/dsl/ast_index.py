@@ -0,0 +1,288 @@
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Hashable
+from heapq import merge
+from typing import Callable, Optional
+from utils.dsl.access_path import segment_ids
+from utils.dsl.query_cache import QUERY_CACHE_BYTES_PER_NODE, QueryCache
+
+
+class ASTIndex:
+    """Inverted indexes over the nodes of one parsed tree, built once after parsing.
+
+    Every node is numbered with an enter ordinal (its pre-order position) and an exit ordinal
+    (one past the enter ordinal of its last descendant), so the subtree of a node is the slice
+    nodes[node._enter:node._exit] and containment is an integer range check.
+
+    Every bucket holds its nodes in pre-order, so lookups return nodes in the same order as a
+    recursive walk would, are restricted to a subtree with two bisections, and only cost the
+    number of matches instead of a full traversal.
+
+    Buckets:
+        by_ident: ident -> nodes (Rust)
+        by_node_type: nodeType -> nodes (Solidity)
+        by_metadata: (metadata key, metadata value) -> nodes, for hashable values
+        by_metadata_key: metadata key -> nodes having that key
+        by_path_suffix: last access path segment id (e.g. of "fn" or "modifierName") -> nodes
+        by_path_prefix: key segment id -> prefix path -> nodes whose path continues the prefix
+            with the key (e.g. the operands under "...cond.binary" + "right"), built on first use
+
+    Query results:
+        query_cache: LRU cache of DSL query results on the tree, shared by every template that
+            runs on it, with a memory budget proportional to the size of the tree
+
+    Summaries:
+        ident_summaries: per enter ordinal, a 64 bit Bloom filter of the idents of the subtree,
+            built on first use, so that a subtree lacking an ident is ruled out in constant time
+
+    With columnar=True the index also keeps an ASTColumns struct-of-arrays view of the tree,
+    which some lookups use to run as vectorized masks. With lazy=True, method calls chained on
+    node lists of the tree build fused plans that only run once the list is read.
+    """
+
+    def __init__(self, root, columnar: bool = False, lazy: bool = False):
+        self.root = root
+        self.lazy = lazy
+        self.nodes = []
+        self.by_ident = defaultdict(list)
+        self.by_node_type = defaultdict(list)
+        self.by_metadata = defaultdict(list)
+        self.by_metadata_key = defaultdict(list)
+        self.by_path_suffix = defaultdict(list)
+
+        # Iterative walk so that exit ordinals can be set once all descendants are numbered
+        stack = [(root, False)]
+        while stack:
+            node, exiting = stack.pop()
+            if exiting:
+                node._exit = len(self.nodes)
+                continue
+            node._index = self
+            node._enter = len(self.nodes)
+            self.nodes.append(node)
+            self._add(node)
+            stack.append((node, True))
+            if node.children:
+                # Children are only added while the tree is built, and the tree is shared
+                # between templates from here on
+                node.children = tuple(node.children)
+                stack.extend((child, False) for child in reversed(node.children))
+
+        self.by_path_prefix = {}
+        self._ident_summaries = None
+        self.query_cache = QueryCache(max_bytes=len(self.nodes) * QUERY_CACHE_BYTES_PER_NODE)
+
+        self.columns = None
+        if columnar:
+            from utils.dsl.ast_columns import ASTColumns
+
+            self.columns = ASTColumns(self)
+
+    @property
+    def size(self) -> int:
+        return len(self.nodes)
+
+    def _add(self, node):
+        ident = getattr(node, "ident", None)
+        if ident is not None:
+            self.by_ident[ident].append(node)
+
+        node_type = getattr(node, "node_type", None)
+        if node_type is not None:
+            self.by_node_type[node_type].append(node)
+
+        for key, value in (node._metadata or {}).items():
+            self.by_metadata_key[key].append(node)
+            if isinstance(value, Hashable):
+                self.by_metadata[(key, value)].append(node)
+
+        if node._access_path.depth:
+            self.by_path_suffix[node._access_path.segment].append(node)
+
+    def contains(self, ancestor, node) -> bool:
+        """Check whether node is ancestor itself or one of its descendants."""
+        if getattr(node, "_index", None) is not self or ancestor._index is not self:
+            return False
+        return ancestor._enter <= node._enter < ancestor._exit
+
+    def subtree(self, node) -> list:
+        """Return a node and its descendants in pre-order."""
+        return self.nodes[node._enter : node._exit]
+
+    def within(self, nodes: list, node) -> list:
+        """Slice a pre-ordered list of indexed nodes down to the ones inside a subtree."""
+        if node is self.root:
+            return nodes
+        start = bisect_left(nodes, node._enter, key=enter_ordinal)
+        end = bisect_left(nodes, node._exit, key=enter_ordinal, lo=start)
+        return nodes[start:end]
+
+    def enclosing(self, nodes: list, node):
+        """Find the innermost node of a pre-ordered list that strictly encloses a node.
+
+        Args:
+            nodes: Pre-ordered list of indexed nodes (e.g. a bucket).
+            node: Node to find the enclosing candidate for.
+
+        Returns:
+            The closest ancestor found in nodes, or None.
+        """
+        # Candidates entered before the node; the closest one still open at that point encloses it
+        position = bisect_left(nodes, node._enter, key=enter_ordinal)
+        for candidate_position in range(position - 1, -1, -1):
+            if nodes[candidate_position]._exit > node._enter:
+                return nodes[candidate_position]
+        return None
+
+    def ancestors(self, nodes: list, node) -> list:
+        """Find all nodes of a pre-ordered list that strictly enclose a node, outermost first."""
+        position = bisect_left(nodes, node._enter, key=enter_ordinal)
+        return [candidate for candidate in nodes[:position] if candidate._exit > node._enter]
+
+    def nodes_under(self, prefix, key: str) -> list:
+        """Return the nodes whose access path starts with a prefix path followed by a key.
+
+        The nodes are grouped by (prefix, key) the first time a key is asked for, in one pass
+        over the nodes that looks at every path object only once.
+
+        Returns:
+            Nodes in pre-order.
+        """
+        segments = segment_ids([key])
+        if segments is None:
+            return []
+        segment = segments[0]
+        groups = self.by_path_prefix.get(segment)
+        if groups is None:
+            groups = self.by_path_prefix[segment] = defaultdict(list)
+            # Prefixes followed by the key, of every path object seen so far
+            prefixes_of = {}
+            for node in self.nodes:
+                for node_prefix in self._prefixes_before(node._access_path, segment, prefixes_of):
+                    groups[node_prefix].append(node)
+        return groups.get(prefix, [])
+
+    @staticmethod
+    def _prefixes_before(path, segment: int, prefixes_of: dict) -> tuple:
+        unknown = []
+        while path is not None and path not in prefixes_of:
+            unknown.append(path)
+            path = path.parent
+        prefixes = prefixes_of[path] if path is not None else ()
+        for path in reversed(unknown):
+            if path.segment == segment:
+                prefixes = prefixes + (path.parent,)
+            prefixes_of[path] = prefixes
+        return prefixes
+
+    def last_top_most_under(self, prefix, key: str, within):
+        """Find the last node of a subtree under a path position, not looking below matches.
+
+        This is what a pre-order walk of the subtree of within returns when it keeps the last node
+        whose access path starts with prefix followed by key and does not descend into matches:
+        the outermost match enclosing the last matching node.
+        """
+        nodes = self.within(self.nodes_under(prefix, key), within)
+        if not nodes:
+            return None
+        match = node = nodes[-1]
+        while node is not within:
+            node = node.parent
+            if node._access_path.starts_with(prefix, key):
+                match = node
+        return match
+
+    @property
+    def ident_summaries(self) -> list:
+        if self._ident_summaries is None:
+            # Children come after their parent in pre-order, so one backward pass fills every entry
+            summaries = [0] * len(self.nodes)
+            for position in range(len(self.nodes) - 1, -1, -1):
+                node = self.nodes[position]
+                bits = ident_bits(getattr(node, "ident", None))
+                for child in node.children:
+                    bits |= summaries[child._enter]
+                summaries[position] = bits
+            self._ident_summaries = summaries
+        return self._ident_summaries
+
+    def may_contain_ident(self, node, ident) -> bool:
+        """Check whether the subtree of a node may contain an ident; False is always exact."""
+        bits = ident_bits(ident)
+        return not bits or self.ident_summaries[node._enter] & bits == bits
+
+    def contains_ident(self, node, ident) -> bool:
+        """Check whether a node or one of its descendants has a (non None) ident."""
+        return self.may_contain_ident(node, ident) and bool(
+            self.lookup(self.by_ident, [ident], node)
+        )
+
+    def lookup(self, bucket: dict, keys, within) -> list:
+        """Collect the nodes of several buckets that are located within a subtree.
+
+        Args:
+            bucket: One of the index dictionaries (e.g. self.by_ident).
+            keys: Keys to collect nodes for.
+            within: Node whose subtree (itself included) limits the results.
+
+        Returns:
+            List of matching nodes in pre-order.
+        """
+        lists = [
+            bucket[key]
+            for key in dict.fromkeys(key for key in keys if isinstance(key, Hashable))
+            if key in bucket
+        ]
+        if not lists:
+            return []
+        lists = [self.within(nodes, within) for nodes in lists]
+        if len(lists) == 1:
+            return list(lists[0])
+        return list(merge(*lists, key=enter_ordinal))
+
+
+def enter_ordinal(node) -> int:
+    return node._enter
+
+
+def ident_bits(ident) -> int:
+    """Return the two Bloom filter bits of an ident, or 0 for values that are not indexed."""
+    if ident is None or not isinstance(ident, Hashable):
+        return 0
+    ident_hash = hash(ident)
+    return 1 << (ident_hash & 63) | 1 << ((ident_hash >> 6) & 63)
+
+
+def iter_subtree(node, prune: Optional[Callable] = None):
+    """Iterate over a node and its descendants in pre-order, with an explicit stack.
+
+    Args:
+        node: Node to start from, yielded first.
+        prune: Optional callable; the descendants of the nodes it returns True for are skipped.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        if node.children and (prune is None or not prune(node)):
+            stack.extend(reversed(node.children))
+
+
+def subtree_has_ident(node, ident) -> bool:
+    """Check whether a node or one of its descendants has an ident."""
+    if node.ident == ident:
+        return True
+    if not node.children:
+        return False
+    if ident is None:
+        # Nodes without an ident are not indexed
+        return any(sub_node.ident is None for sub_node in iter_subtree(node))
+    return get_index(node).contains_ident(node, ident)
+
+
+def get_index(node) -> ASTIndex:
+    """Return the index a node belongs to, indexing its subtree if it is not part of a parsed tree yet."""
+    index = getattr(node, "_index", None)
+    if index is None:
+        index = ASTIndex(node)
+    return index
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import marshal
+import os
+from pathlib import Path
+import sys
+import tempfile
+import threading
+from types import CodeType
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of compiled rules kept in memory; the builtin templates take about a tenth of it
+CODE_CACHE_MAX_ENTRIES = 1024
+
+
+def compute_code_digest(code: str, policy: str) -> str:
+    """Hash a rule together with the sandbox policy it was validated against.
+
+    Args:
+        code: Template rule source.
+        policy: Sandbox policy fingerprint, see utils.dsl.dsl.sandbox_policy_fingerprint.
+
+    Returns:
+        Hex encoded sha256.
+    """
+    return hashlib.sha256(f"{policy}\0{code}".encode()).hexdigest()
+
+
+class CompiledCodeCache:
+    """Process-local LRU cache of validated and compiled template rules.
+
+    Rules almost never change between scans, so each one only needs to be parsed, checked by
+    the sandbox transformer and compiled once per worker. Entries are keyed by a digest of the
+    rule text and the sandbox policy, so a policy change validates every rule again.
+
+    With a directory set, compiled rules are also marshalled to disk (per Python version, since
+    code objects are not portable between versions) and loaded from there after a restart.
+    Files loaded from disk are trusted to have passed validation, so the directory must only be
+    writable by the workers.
+    """
+
+    def __init__(self, max_entries: int = CODE_CACHE_MAX_ENTRIES, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compile(self, code: str, policy: str, compile_code: Callable[[str], CodeType]) -> CodeType:
+        """Return the compiled code object of a rule, validating and compiling it on a miss.
+
+        Args:
+            code: Template rule source.
+            policy: Sandbox policy fingerprint the rule is validated against.
+            compile_code: Callable validating and compiling the rule; its errors are not cached.
+
+        Returns:
+            The compiled code object.
+        """
+        digest = compute_code_digest(code, policy)
+        with self._lock:
+            code_object = self._entries.get(digest)
+            if code_object is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return code_object
+
+        code_object = self._load(digest)
+        if code_object is None:
+            code_object = compile_code(code)
+            self._store(digest, code_object)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.disk_hits += 1
+
+        with self._lock:
+            self._entries[digest] = code_object
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return code_object
+
+    def _path(self, digest: str) -> Optional[Path]:
+        if not self.directory:
+            return None
+        return Path(self.directory) / sys.implementation.cache_tag / f"{digest}.marshal"
+
+    def _load(self, digest: str) -> Optional[CodeType]:
+        path = self._path(digest)
+        if path is None or not path.exists():
+            return None
+        try:
+            code_object = marshal.loads(path.read_bytes())
+        except (OSError, ValueError, EOFError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable compiled rule {path}: {e}")
+            return None
+        return code_object if isinstance(code_object, CodeType) else None
+
+    def _store(self, digest: str, code_object: CodeType):
+        path = self._path(digest)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside and renamed so that concurrent workers never read a partial file
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+                file.write(marshal.dumps(code_object))
+            os.replace(file.name, path)
+        except OSError as e:
+            logger.warning(f"Could not persist compiled rule to {path}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return cache counters.
+
+        Returns:
+            Dictionary with hits, disk hits, misses, evictions and entry count.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
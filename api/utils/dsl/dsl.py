@@ -1,13 +1,16 @@
 # WARNING: Unsafe. Use at your own risk.
 import inspect
-from typing import Optional
-from ast import NodeTransformer, parse, AST
+from typing import Mapping, Optional
+from ast import NodeTransformer, parse, AST, Del, Store
 import builtins
 import io
 import json
 import sys
-from types import ModuleType
+from pathlib import Path
+from types import CodeType, ModuleType
+import yaml
 from utils.dsl import dsl_ast_iterator
+from utils.dsl.code_cache import CompiledCodeCache
 
 
 # regular print, but tries to decode printed json outputs (to get a proper json instead of python-flavoured json)
@@ -77,30 +80,128 @@ class SandboxTransformer(NodeTransformer):
 
         return self.generic_visit(node)
 
+    def visit_Attribute(self, node):
+        # Parsed trees and query results are shared by the templates of a worker, so rules
+        # may read node attributes but never assign or delete them
+        if isinstance(node.ctx, (Store, Del)):
+            raise RuntimeError(f"[e] Assigning attributes is not allowed: {node.attr}")
+        return self.generic_visit(node)
+
+
+# Bump whenever SandboxTransformer changes what it allows, so rules compiled under the previous
+# policy (including the ones persisted on disk) are validated again
+SANDBOX_POLICY_VERSION = 4
+
+
+def sandbox_policy_fingerprint() -> str:
+    return "|".join(
+        [
+            str(SANDBOX_POLICY_VERSION),
+            ",".join(sorted(allowed_builtins)),
+            ",".join(sorted(allowed_imports)),
+        ]
+    )
+
+
+# Validated and compiled template rules, see utils/dsl/code_cache.py
+compiled_code_cache = CompiledCodeCache()
 
-def wrapped_exec(code: str) -> list:
+
+def compile_rule(code: str) -> CodeType:
+    tree = parse(code)
+    transformer = SandboxTransformer()
+    transformer.visit(tree)
+    return compile(tree, filename="<ast>", mode="exec")
+
+
+def get_compiled_rule(code: str) -> CodeType:
+    return compiled_code_cache.get_or_compile(code, sandbox_policy_fingerprint(), compile_rule)
+
+
+# Compiles the rules of every template under templates_path ahead of the first scan.
+# Rules that fail to load or validate are skipped, their scans report the error as usual
+def warm_code_cache(templates_path) -> int:
+    warmed = 0
+    for yaml_file in sorted(Path(templates_path).rglob("*.yaml")):
+        try:
+            with open(yaml_file, "r") as f:
+                get_compiled_rule(yaml.safe_load(f)["rule"])
+            warmed += 1
+        except Exception:
+            continue
+    return warmed
+
+
+# Nodes of a report() argument: a node, or a node list, group, list or tuple of nodes
+def reported_nodes(node_or_list) -> list:
+    if isinstance(node_or_list, dsl_ast_iterator.ASTNode):
+        return [node_or_list]
+    if isinstance(node_or_list, dsl_ast_iterator.ASTNodeListGroup):
+        return [node for node_list in node_or_list for node in reported_nodes(node_list)]
+    if isinstance(node_or_list, (dsl_ast_iterator.ASTNodeList, list, tuple)):
+        nodes = list(node_or_list)
+        if all(isinstance(node, dsl_ast_iterator.ASTNode) for node in nodes):
+            return nodes
+    raise TypeError(f"[e] report() expects AST nodes, got: {type(node_or_list).__name__}")
+
+
+# Builds the report() function of a template run. Reported nodes are recorded by reference into
+# reported; without a list to record into they are printed like print(node.to_result()) would
+def make_report(reported: Optional[list] = None):
+    def report(node_or_list):
+        nodes = reported_nodes(node_or_list)
+        if reported is None:
+            print_try_jsonify([node.to_result() for node in nodes])
+        else:
+            reported.extend(nodes)
+
+    return report
+
+
+# Runs sandboxed template code. Objects such as the parsed AST are handed over by reference
+# through injected_globals, so only the template rule itself gets parsed, validated and compiled,
+# and only once per rule thanks to compiled_code_cache.
+# Nodes the template passes to report() are appended to reported
+def wrapped_exec(
+    code: str, injected_globals: Optional[dict] = None, reported: Optional[list] = None
+) -> list:
     old_stdout = sys.stdout
     redirected_output = io.StringIO()
     sys.stdout = redirected_output
 
+    exec_globals = dict(sandbox_globals)
+    exec_globals["report"] = make_report(reported)
+    if injected_globals:
+        exec_globals.update(injected_globals)
+
     try:
-        tree = parse(code)
-        transformer = SandboxTransformer()
-        transformer.visit(tree)
-        exec(compile(tree, filename="<ast>", mode="exec"), sandbox_globals)
+        exec(get_compiled_rule(code), exec_globals)
     finally:
         sys.stdout = old_stdout
 
     return redirected_output.getvalue().splitlines()
 
 
-def inject_code_lines(code: str, args: list) -> str:
-    arg_lines = "\n".join(args)
-    return arg_lines + "\n" + code
+# Location string of a reported node, the same one extract_location gives for its printed result
+def node_location(node) -> Optional[str]:
+    src = node.src
+    # Rust format: src is a read-only view of a dict with file, line, start_col, end_col
+    if isinstance(src, Mapping):
+        return f"{src['file']}:{src['line']}:{src['start_col']}-{src['end_col']}"
 
+    # Solidity format: src_calculated has the location, or file + raw src string
+    src_calculated = getattr(node, "src_calculated", None)
+    if src_calculated:
+        return src_calculated
+    if isinstance(src, str) and hasattr(node, "file"):
+        return f"{node.file}:{src}"
 
-# Iterate over outputs, treat only ast nodes (dict types with an 'ident' & 'src' key on the top level)
-def process_template_outputs(template_outputs, yaml_data):
+    return None
+
+
+# Iterate over outputs, treat only ast nodes (dict types with an 'ident' & 'src' key on the top level).
+# Nodes recorded through report() are located directly, after the printed ones
+def process_template_outputs(template_outputs, yaml_data, reported: Optional[list] = None):
     finding_data = {
         "name": yaml_data["name"],
         "description": yaml_data["description"],
@@ -149,6 +250,11 @@ def process_template_outputs(template_outputs, yaml_data):
         else:
             finding_data["debug"].append(output)
 
+    for node in reported or ():
+        location = node_location(node)
+        if location:
+            finding_data["locations"].append(location)
+
     if not finding_data["debug"]:
         del finding_data["debug"]
 
@@ -1,96 +1,69 @@
-from functools import wraps
-from dataclasses import dataclass, field
-from typing import List, Optional
+from itertools import islice
 import json
-
-
-def dsl_log(func):
-    """Decorator for logging DSL function calls and their results.
-
-    Args:
-        func: The function to be decorated.
-
-    Returns:
-        Wrapped function that logs its execution details.
-    """
-
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        func_name = func.__name__
-        args_str = ", ".join(
-            str(arg)[:50] + "..." if len(str(arg)) > 50 else str(arg)
-            for arg in args[1:]
-        )
-        kwargs_str = ", ".join(
-            f"{k}={str(v)[:30] + '...' if len(str(v)) > 30 else str(v)}"
-            for k, v in kwargs.items()
-        )
-        params = ", ".join(filter(None, [args_str, kwargs_str]))
-
-        try:
-            result = func(*args, **kwargs)
-
-            node_count = 0
-            if hasattr(result, "__len__"):
-                node_count = len(result)
-            elif result is not None:
-                node_count = 1
-
-            # Special handling for exit methods
-            if func_name == "exit_on_none":
-                print(
-                    f"[d] [dsl_log] {func_name}({params}) -> continued ({node_count} nodes)"
-                )  # should always be >1
-            elif func_name == "exit_on_value":
-                print(
-                    f"[d] [dsl_log] {func_name}({params}) -> continued ({node_count} nodes)"
-                )  # should always be 0
-            else:
-                print(f"[d] [dsl_log] {func_name}({params}) -> {node_count} nodes")
-            return result
-        except StopIteration as e:
-            print(f"[d] [dsl_log] {func_name}({params}) -> StopIteration: {e}")
-            raise
-
-    return wrapper
+from types import MappingProxyType
+from typing import Mapping, Optional
+from utils.dsl.access_path import EMPTY_ACCESS_PATH, segment_id
+from utils.dsl.ast_index import (
+    ASTIndex,
+    get_index,
+    iter_subtree,
+    subtree_has_ident,
+)
+from utils.dsl.query_cache import cached_query
+from utils.dsl.tracing import dsl_log
+
+# Levels of children shown by to_raw_ast_debug() unless asked otherwise
+DEBUG_RESULT_DEPTH = 3
 
 
 class ASTNodeListGroup:
     def __init__(self, node_lists):
-        self.node_lists = node_lists if isinstance(node_lists, list) else [node_lists]
+        self._node_lists = node_lists if isinstance(node_lists, list) else [node_lists]
 
     def __getattr__(self, name):
         def method(*args, **kwargs):
             results = []
-            for node_list in self.node_lists:
+            for node_list in self._node_lists:
                 method = getattr(node_list, name, None)
                 if method:
                     result = method(*args, **kwargs)
                     if isinstance(result, ASTNodeList):
-                        results.extend(result.nodes)
+                        results.extend(result._materialize())
                     elif result is not None:
                         results.append(result)
             return ASTNodeList(results)
 
         return method
 
+    @property
+    def node_lists(self) -> list:
+        # A copy, since groups can be shared between templates through the query cache
+        return list(self._node_lists)
+
+    def _ref_count(self) -> int:
+        # Node references held, for the query cache budget
+        return len(self._node_lists) + sum(node_list._ref_count() for node_list in self._node_lists)
+
     def __iter__(self):
-        return iter(self.node_lists)
+        return iter(self._node_lists)
 
     def __len__(self):
-        return len(self.node_lists)
+        return len(self._node_lists)
 
     def __getitem__(self, index):
-        return self.node_lists[index]
+        return self._node_lists[index]
 
     @dsl_log
-    def to_result(self):
+    def to_result(self, depth: Optional[int] = 0):
         """Convert the node list group to result format.
 
+        Args:
+            depth: Levels of children to include in each result, see ASTNode.to_result.
+
         Returns:
             List of result dictionaries for each node list in the group.
         """
-        return [node_list.to_result() for node_list in self.node_lists]
+        return [node_list.to_result(depth) for node_list in self._node_lists]
 
     @dsl_log
     def first(self):
@@ -99,7 +72,7 @@ class ASTNodeListGroup:
         Returns:
             The first node list in the group, or raises StopIteration if empty.
         """
-        return self.node_lists[0] if self.node_lists else self.exit_on_none()
+        return self._node_lists[0] if self._node_lists else self.exit_on_none()
 
     @dsl_log
     def exit_on_none(self):
@@ -111,7 +84,7 @@ class ASTNodeListGroup:
         Raises:
             StopIteration: If no node lists are found.
         """
-        if not self.node_lists:
+        if not self._node_lists:
             raise StopIteration("No node lists found")
         return self
 
@@ -125,21 +98,25 @@ class ASTNodeListGroup:
         Raises:
             StopIteration: If node lists are found.
         """
-        if self.node_lists:
+        if self._node_lists:
             raise StopIteration("Node lists found")
         return self
 
-    def to_raw_ast_debug(self):
+    def to_raw_ast_debug(self, depth: Optional[int] = DEBUG_RESULT_DEPTH):
         """Print debug information for the node list group.
 
+        Args:
+            depth: Levels of children to print below each node. Defaults to DEBUG_RESULT_DEPTH;
+                None prints whole subtrees.
+
         Returns:
             Self for method chaining.
         """
         result_data = []
-        for i, node_list in enumerate(self.node_lists):
+        for i, node_list in enumerate(self._node_lists):
             group_data = []
-            for node in node_list.nodes:
-                group_data.append(node.to_result())
+            for node in node_list:
+                group_data.append(node.to_result(depth))
             result_data.append(group_data)
 
         print()
@@ -151,42 +128,134 @@ class ASTNodeListGroup:
 
 class ASTNodeList:
     def __init__(self, nodes):
-        self.nodes = nodes if isinstance(nodes, list) else [nodes]
+        self._nodes = nodes if isinstance(nodes, list) else [nodes]
+        self._index = None
+        self._ordinals = None
+        self._plan = None
+
+    @classmethod
+    def from_ordinals(cls, index, ordinals) -> "ASTNodeList":
+        """Wrap an array of node ordinals of an index (e.g. a vectorized query result).
+
+        Node objects are only looked up once the list is iterated or converted.
+        """
+        node_list = cls([])
+        node_list._nodes = None
+        node_list._index = index
+        node_list._ordinals = ordinals
+        return node_list
+
+    @classmethod
+    def from_plan(cls, source: "ASTNodeList", name: str, args, kwargs) -> "ASTNodeList":
+        """Wrap a method call on every node of a source list, evaluated once the list is read.
+
+        Plans chain: reading the last list of a chain streams every node through all of its
+        steps in one pass, without building the intermediate lists.
+        """
+        node_list = cls([])
+        node_list._nodes = None
+        node_list._plan = (source, name, args, kwargs)
+        return node_list
+
+    @property
+    def nodes(self) -> list:
+        # A copy, since lists can be shared between templates through the query cache
+        return list(self._materialize())
+
+    def _materialize(self) -> list:
+        if self._nodes is None:
+            if self._plan is not None:
+                self._nodes = self._collect(self._stream())
+                self._plan = None
+            else:
+                self._nodes = [self._index.nodes[ordinal] for ordinal in self._ordinals.tolist()]
+        return self._nodes
+
+    def _is_lazy(self) -> bool:
+        if self._plan is not None:
+            return True
+        index = self._index
+        if index is None and self._nodes:
+            index = getattr(self._nodes[0], "_index", None)
+        return index is not None and index.lazy
+
+    def _stream(self):
+        if self._plan is None:
+            return iter(self._materialize())
+        source, name, args, kwargs = self._plan
+        return self._call_each(source._stream(), name, args, kwargs)
+
+    def _head(self) -> list:
+        """Evaluate a plan up to its first node; a plan found to be empty is materialized."""
+        head = self._collect(islice(self._stream(), 1))
+        if not head:
+            self._nodes = []
+            self._plan = None
+        return head
+
+    @staticmethod
+    def _call_each(nodes, name: str, args, kwargs):
+        for node in nodes:
+            node_method = getattr(node, name, None)
+            if node_method:
+                result = node_method(*args, **kwargs)
+                if isinstance(result, list):
+                    yield from result
+                elif isinstance(result, ASTNodeList):
+                    yield from result._stream()
+                elif result is not None:
+                    yield result
+
+    @staticmethod
+    def _collect(stream) -> list:
+        try:
+            return list(stream)
+        except RuntimeError as error:
+            # A StopIteration raised by a query is turned into a RuntimeError by the generator
+            if isinstance(error.__cause__, StopIteration):
+                raise error.__cause__
+            raise
 
     def __getattr__(self, name):
         def method(*args, **kwargs):
-            results = []
-            for node in self.nodes:
-                node_method = getattr(node, name, None)
-                if node_method:
-                    result = node_method(*args, **kwargs)
-                    if isinstance(result, list):
-                        results.extend(result)
-                    elif isinstance(result, ASTNodeList):
-                        results.extend(result.nodes)
-                    elif result is not None:
-                        results.append(result)
-            return ASTNodeList(results)
+            if self._is_lazy():
+                return ASTNodeList.from_plan(self, name, args, kwargs)
+            nodes = self._materialize()
+            return ASTNodeList(self._collect(self._call_each(nodes, name, args, kwargs)))
 
         return method
 
+    def _ref_count(self) -> int:
+        # Node references held, for the query cache budget; a plan is counted like its source,
+        # without running it
+        if self._plan is not None:
+            return self._plan[0]._ref_count()
+        if self._nodes is None:
+            return len(self._ordinals)
+        return len(self._nodes)
+
     def __iter__(self):
-        return iter(self.nodes)
+        return iter(self._materialize())
 
     def __len__(self):
-        return len(self.nodes)
+        if self._nodes is None and self._plan is None:
+            return len(self._ordinals)
+        return len(self._materialize())
 
     def __getitem__(self, index):
-        return self.nodes[index]
+        return self._materialize()[index]
 
     @dsl_log
-    def to_result(self):
+    def to_result(self, depth: Optional[int] = 0):
         """Convert the node list to result format.
 
+        Args:
+            depth: Levels of children to include in each result, see ASTNode.to_result.
+
         Returns:
             List of result dictionaries for each node in the list.
         """
-        return [node.to_result() for node in self.nodes]
+        return [node.to_result(depth) for node in self._materialize()]
 
     @dsl_log
     def first(self):
@@ -195,7 +264,13 @@ class ASTNodeList:
         Returns:
             The first node in the list, or raises StopIteration if empty.
         """
-        return self.nodes[0] if self.nodes else self.exit_on_none()
+        if self._plan is not None:
+            head = self._head()
+            return head[0] if head else self.exit_on_none()
+        if self._nodes is None and len(self._ordinals):
+            return self._index.nodes[self._ordinals[0]]
+        nodes = self._materialize()
+        return nodes[0] if nodes else self.exit_on_none()
 
     @dsl_log
     def exit_on_none(self):
@@ -207,7 +282,7 @@ class ASTNodeList:
         Raises:
             StopIteration: If no nodes are found.
         """
-        if not self.nodes:
+        if not len(self):
             raise StopIteration("No nodes found")
         return self
 
@@ -221,17 +296,21 @@ class ASTNodeList:
         Raises:
             StopIteration: If nodes are found.
         """
-        if self.nodes:
+        if self._head() if self._plan is not None else len(self):
             raise StopIteration("Nodes found")
         return self
 
-    def to_raw_ast_debug(self):
+    def to_raw_ast_debug(self, depth: Optional[int] = DEBUG_RESULT_DEPTH):
         """Print debug information for the node list.
 
+        Args:
+            depth: Levels of children to print below each node. Defaults to DEBUG_RESULT_DEPTH;
+                None prints whole subtrees.
+
         Returns:
             Self for method chaining.
         """
-        result_data = [node.to_result() for node in self.nodes]
+        result_data = [node.to_result(depth) for node in self._materialize()]
 
         print()
         print("Raw AST Node List Debug:")
@@ -240,24 +319,64 @@ class ASTNodeList:
         return self
 
 
-@dataclass
+# Shared by every leaf node until its first child is added
+NO_CHILDREN = ()
+
+# Shared by every node until metadata is assigned to it
+EMPTY_METADATA = MappingProxyType({})
+
+
 class ASTNode:
-    src: Optional[str | dict] = None
-    access_path: str = ""
-    metadata: dict = field(default_factory=dict)
-    children: List["ASTNode"] = field(default_factory=list)
-    parent: Optional["ASTNode"] = None
-    root: bool = False
-
-    def __init__(self, node=None, access_path="", metadata={}):
-        if node:
-            self.src = node.get("src")
-        else:
-            self.root = True
+    """A parsed AST node.
+
+    Nodes are slotted and only allocate a metadata dict and a children list once they have
+    something to hold, since large projects parse into millions of nodes. Until then metadata
+    reads return the shared, read-only EMPTY_METADATA; assign node.metadata to change it.
+
+    Parsed trees are shared between templates, so the data rules can reach is read-only: a src
+    dict is kept as a read-only view and ASTIndex turns the children lists into tuples once
+    the tree is built.
+    """
 
-        self.metadata = metadata
-        self.children = []
-        self.access_path = access_path
+    __slots__ = (
+        "src",
+        "_access_path",
+        "_metadata",
+        "children",
+        "parent",
+        "root",
+        "_index",
+        "_enter",
+        "_exit",
+    )
+
+    def __init__(self, node=None, access_path=EMPTY_ACCESS_PATH, metadata=None):
+        src = node.get("src") if node else None
+        self.src = MappingProxyType(src) if isinstance(src, dict) else src
+        self.root = not node
+        self._access_path = access_path
+        self._metadata = metadata or None
+        self.children = NO_CHILDREN
+        self.parent = None
+        self._index = None
+
+    @property
+    def access_path(self) -> str:
+        """Dotted access path string, built from the interned path segments on each access."""
+        return str(self._access_path)
+
+    @property
+    def metadata(self) -> Mapping:
+        # A read-only view, since parsed trees are shared between templates. Reading the
+        # metadata of a node without any does not allocate (or change the tree)
+        return EMPTY_METADATA if self._metadata is None else MappingProxyType(self._metadata)
+
+    @metadata.setter
+    def metadata(self, metadata: dict):
+        self._metadata = metadata
+
+    def __repr__(self):
+        return f"{type(self).__name__}(access_path={self.access_path!r}, src={self.src!r})"
 
     def add_child(self, child: "ASTNode"):
         """Add a child node to this node.
@@ -266,27 +385,38 @@ class ASTNode:
             child: The child ASTNode to add.
         """
         child.parent = self
-        self.children.append(child)
+        if self.children:
+            self.children.append(child)
+        else:
+            self.children = [child]
 
-    def to_result(self):
+    def to_result(self, depth: Optional[int] = 0):
         """Convert the node to result format.
 
+        Findings only need the location of a node, so by default its subtree is left out.
+
+        Args:
+            depth: Levels of children to include. Defaults to 0, a result without children;
+                None includes the whole subtree.
+
         Returns:
-            Dictionary representation of the node including source, children, access path, and metadata.
+            Dictionary representation of the node including source, access path, metadata, and
+            children down to depth.
         """
-        return {
-            "src": self.src,
-            "children": [child.to_result() for child in self.children],
-            "access_path": self.access_path,
-            "metadata": self.metadata,
-        }
+        # Copies, so results cannot change a tree shared between templates
+        result = {"src": dict(self.src) if isinstance(self.src, Mapping) else self.src}
+        if depth is None or depth > 0:
+            child_depth = None if depth is None else depth - 1
+            result["children"] = [child.to_result(child_depth) for child in self.children]
+        result["access_path"] = self.access_path
+        result["metadata"] = dict(self._metadata) if self._metadata else {}
+        return result
 
 
-@dataclass
 class RustASTNode(ASTNode):
-    ident: str = "root"
+    __slots__ = ("ident",)
 
-    def __init__(self, node=None, access_path="", metadata={}):
+    def __init__(self, node=None, access_path=EMPTY_ACCESS_PATH, metadata=None):
         super().__init__(node, access_path, metadata)
         if node:
             self.ident = node.get("ident")
@@ -294,13 +424,16 @@ class RustASTNode(ASTNode):
             self.ident = "root"
             self.root = True
 
-    def to_result(self):
+    def to_result(self, depth: Optional[int] = 0):
         """Convert the Rust AST node to result format.
 
+        Args:
+            depth: Levels of children to include, see ASTNode.to_result.
+
         Returns:
             Dictionary representation of the node including identifier and parent information.
         """
-        result = super().to_result()
+        result = super().to_result(depth)
         result.update(
             {
                 "ident": self.ident,
@@ -309,19 +442,17 @@ class RustASTNode(ASTNode):
         )
         return result
 
-    def to_raw_ast_debug(self):
+    def to_raw_ast_debug(self, depth: Optional[int] = DEBUG_RESULT_DEPTH):
         """Print debug information for the Rust AST node.
 
+        Args:
+            depth: Levels of children to print. Defaults to DEBUG_RESULT_DEPTH; None prints the
+                whole subtree.
+
         Returns:
             Self for method chaining.
         """
-        result = super().to_result()
-        result.update(
-            {
-                "ident": self.ident,
-                "parent": self.parent.ident if self.parent else None,
-            }
-        )
+        result = self.to_result(depth)
         print()
         print("Raw AST Node Debug:")
         print(json.dumps(result, indent=4, default=str))
@@ -329,6 +460,7 @@ class RustASTNode(ASTNode):
         return self
 
     @dsl_log
+    @cached_query
     def find_by_parent(self, parent_ident: str) -> ASTNodeList:
         """Find all nodes that have a specific parent identifier.
 
@@ -338,14 +470,20 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes that have the specified parent identifier.
         """
-        results = []
+        index = get_index(self)
+        matches = [
+            child
+            for parent in index.by_ident.get(parent_ident, [])
+            for child in parent.children
+            if child is not self and index.contains(self, child)
+        ]
         if self.parent and self.parent.ident == parent_ident:
-            results.append(self)
-        for child in self.children:
-            results.extend(child.find_by_parent(parent_ident))
-        return ASTNodeList(results)
+            matches.append(self)
+        matches.sort(key=lambda node: node._enter)
+        return ASTNodeList(matches)
 
     @dsl_log
+    @cached_query
     def find_by_child(self, child_ident: str) -> ASTNodeList:
         """Find all nodes that have a specific child identifier.
 
@@ -355,18 +493,17 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes that have a child with the specified identifier.
         """
-        matches = []
-
-        def recurse(node):
-            if any(child.ident == child_ident for child in node.children):
-                matches.append(node)
-            for child in node.children:
-                recurse(child)
-
-        recurse(self)
+        index = get_index(self)
+        parents = {
+            id(child.parent): child.parent
+            for child in index.by_ident.get(child_ident, [])
+            if child.parent is not None and index.contains(self, child.parent)
+        }
+        matches = sorted(parents.values(), key=lambda node: node._enter)
         return ASTNodeList(matches)
 
     @dsl_log
+    @cached_query
     def find_chained_calls(self, *idents: tuple[str, ...]) -> ASTNodeListGroup:
         """Find sequences of chained method calls with specific identifiers.
 
@@ -378,19 +515,31 @@ class RustASTNode(ASTNode):
         """
         matches = []
 
-        def recurse(node, idents):
+        def match_children(node):
             for i in range(len(node.children) - len(idents) + 1):
                 if all(
                     node.children[i + j].ident == idents[j] for j in range(len(idents))
                 ):
-                    matches.append(ASTNodeList(node.children[i : i + len(idents)]))
-            for child in node.children:
-                recurse(child, idents)
-
-        recurse(self, idents)
+                    matches.append(ASTNodeList(list(node.children[i : i + len(idents)])))
+
+        if not idents:
+            for node in iter_subtree(self):
+                match_children(node)
+            return ASTNodeListGroup(matches)
+
+        # Only parents of a node carrying the first ident can hold a matching sequence
+        index = get_index(self)
+        parents = {
+            id(first.parent): first.parent
+            for first in index.by_ident.get(idents[0], [])
+            if first.parent is not None and index.contains(self, first.parent)
+        }
+        for parent in sorted(parents.values(), key=lambda node: node._enter):
+            match_children(parent)
         return ASTNodeListGroup(matches)
 
     @dsl_log
+    @cached_query
     def find_by_access_path(self, access_path_part: str) -> ASTNodeList:
         """Find nodes that contain a specific part in their access path.
 
@@ -400,18 +549,13 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes whose access path contains the specified part.
         """
-        matching_nodes = []
-
-        def recurse(node):
-            if access_path_part in node.access_path:
-                matching_nodes.append(node)
-            for child in node.children:
-                recurse(child)
-
-        recurse(self)
+        matching_nodes = [
+            node for node in iter_subtree(self) if access_path_part in node.access_path
+        ]
         return ASTNodeList(matching_nodes)
 
     @dsl_log
+    @cached_query
     def find_macro_attribute_by_names(self, *idents: tuple[str, ...]) -> ASTNodeList:
         """Find macro attributes by their identifier names.
 
@@ -421,26 +565,16 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes that are macro attributes with the specified identifiers.
         """
-        matching_nodes = []
-
-        def search_nodes(node):
-            if isinstance(node, ASTNode):
-                if node.ident in idents and ".meta.list.tokens" in node.access_path:
-                    matching_nodes.append(node)
-                for child in node.children:
-                    search_nodes(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    if isinstance(value, (dict, list)):
-                        search_nodes(value)
-            elif isinstance(node, list):
-                for item in node:
-                    search_nodes(item)
-
-        search_nodes(self)
+        index = get_index(self)
+        matching_nodes = [
+            node
+            for node in index.lookup(index.by_ident, idents, self)
+            if node._access_path.contains("meta", "list", "tokens")
+        ]
         return ASTNodeList(matching_nodes)
 
     @dsl_log
+    @cached_query
     def find_by_similar_access_path(
         self, access_path: str, stop_keyword: str
     ) -> ASTNodeList:
@@ -460,20 +594,14 @@ class RustASTNode(ASTNode):
             truncated_path = access_path
 
         matching_nodes = []
-
-        def recurse(node):
-            if (
-                truncated_path in node.access_path
-                and node.access_path != truncated_path
-            ):
+        for node in iter_subtree(self):
+            node_access_path = node.access_path
+            if truncated_path in node_access_path and node_access_path != truncated_path:
                 matching_nodes.append(node)
-            for child in node.children:
-                recurse(child)
-
-        recurse(self)
         return ASTNodeList(matching_nodes)
 
     @dsl_log
+    @cached_query
     def find_comparisons_between(self, ident1: str, ident2: str):
         """Find binary comparison operations between two specific identifiers.
 
@@ -486,66 +614,46 @@ class RustASTNode(ASTNode):
         """
         comparisons = []
 
-        def traverse(node):
-            if not node:
-                return
+        index = get_index(self)
 
-            if (
-                "cond.binary.left" in node.access_path
-                or "cond.binary.right" in node.access_path
-            ):
-                truncated_path = (
-                    node.access_path.split(".cond.binary")[0] + ".cond.binary"
-                )
-                if "cond.binary.left" in node.access_path:
-                    left_path = truncated_path + ".right"
-                    right_node = find_node_by_access_path(left_path)
-                    if right_node and check_conditions(
-                        node, right_node, ident1, ident2
-                    ):
-                        comparisons.append(ASTNodeList([node, right_node]))
-                elif "cond.binary.right" in node.access_path:
-                    right_path = truncated_path + ".left"
-                    left_node = find_node_by_access_path(right_path)
-                    if left_node and check_conditions(left_node, node, ident1, ident2):
-                        comparisons.append(ASTNodeList([left_node, node]))
-
-            for child in node.children:
-                traverse(child)
-
-        def find_node_by_access_path(access_path):
-            matching_node = None
-
-            def recurse(node):
-                nonlocal matching_node
-                if access_path in node.access_path:
-                    matching_node = node
-                    return
-                for child in node.children:
-                    recurse(child)
-
-            recurse(self)
-            return matching_node
+        def find_node_by_access_path(access_path, key):
+            # The node on the other side of the same operation, found by its path prefix
+            return index.last_top_most_under(access_path, key, self)
 
         def check_conditions(left_node, right_node, ident1, ident2):
             return (
-                check_ident(left_node, ident1) and check_ident(right_node, ident2)
-            ) or (check_ident(left_node, ident2) and check_ident(right_node, ident1))
-
-        def check_ident(node, ident):
-            if not node:
-                return False
-            if node.ident == ident:
-                return True
-            for child in node.children:
-                if check_ident(child, ident):
-                    return True
-            return False
+                subtree_has_ident(left_node, ident1)
+                and subtree_has_ident(right_node, ident2)
+            ) or (
+                subtree_has_ident(left_node, ident2)
+                and subtree_has_ident(right_node, ident1)
+            )
+
+        def lacks_idents(node):
+            # Both sides of a comparison need one of the idents, so such subtrees are skipped
+            return not (
+                index.may_contain_ident(node, ident1) or index.may_contain_ident(node, ident2)
+            )
+
+        for node in iter_subtree(self, prune=lacks_idents):
+            if lacks_idents(node):
+                continue
+            path = node._access_path
+            if path.contains("cond", "binary", "left"):
+                truncated_path = path.find("cond", "binary")
+                right_node = find_node_by_access_path(truncated_path, "right")
+                if right_node and check_conditions(node, right_node, ident1, ident2):
+                    comparisons.append(ASTNodeList([node, right_node]))
+            elif path.contains("cond", "binary", "right"):
+                truncated_path = path.find("cond", "binary")
+                left_node = find_node_by_access_path(truncated_path, "left")
+                if left_node and check_conditions(left_node, node, ident1, ident2):
+                    comparisons.append(ASTNodeList([left_node, node]))
 
-        traverse(self)
         return ASTNodeList(comparisons)
 
     @dsl_log
+    @cached_query
     def find_comparison_involving(self, ident: str):
         """Find any comparison operations that involve a specific identifier.
 
@@ -556,36 +664,27 @@ class RustASTNode(ASTNode):
             ASTNodeList of comparison nodes that involve the specified identifier.
         """
         comparisons = []
+        index = get_index(self)
 
-        def traverse(node):
-            if not node:
-                return
+        def lacks_ident(node):
+            return not index.may_contain_ident(node, ident)
 
+        for node in iter_subtree(self, prune=lacks_ident):
+            if lacks_ident(node):
+                continue
+            path = node._access_path
             if (
-                "cond.binary.left" in node.access_path
-                or "cond.binary.right" in node.access_path
-                or "cond.unary" in node.access_path
+                path.contains("cond", "binary", "left")
+                or path.contains("cond", "binary", "right")
+                or path.contains("cond", "unary")
             ):
-                if check_ident(node, ident):
+                if subtree_has_ident(node, ident):
                     comparisons.append(node)
 
-            for child in node.children:
-                traverse(child)
-
-        def check_ident(node, ident):
-            if not node:
-                return False
-            if node.ident == ident:
-                return True
-            for child in node.children:
-                if check_ident(child, ident):
-                    return True
-            return False
-
-        traverse(self)
         return ASTNodeList(comparisons)
 
     @dsl_log
+    @cached_query
     def find_negative_of_operation(
         self, operation_name: str, *args: tuple
     ) -> ASTNodeList:
@@ -601,18 +700,13 @@ class RustASTNode(ASTNode):
         operation = getattr(self, operation_name)
         operation_results = operation(*args)
         operation_nodes = {node for pair in operation_results for node in pair}
-        non_operation_nodes = []
-
-        def traverse(node):
-            if node not in operation_nodes:
-                non_operation_nodes.append(node)
-            for child in node.children:
-                traverse(child)
-
-        traverse(self)
+        non_operation_nodes = [
+            node for node in iter_subtree(self) if node not in operation_nodes
+        ]
         return ASTNodeList(non_operation_nodes)
 
     @dsl_log
+    @cached_query
     def find_functions_by_names(self, *function_names: tuple[str, ...]) -> ASTNodeList:
         """Find function nodes by their names.
 
@@ -622,53 +716,30 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of function nodes with the specified names.
         """
-        matching_nodes = []
-
-        def find_function(node):
-            if isinstance(node, ASTNode):
-                # Check if this is a function node by looking for .fn at the end of access path
-                # and the ident matches one of the function names
-                if node.ident in function_names and node.access_path.endswith(".fn"):
-                    matching_nodes.append(node)
-                for child in node.children:
-                    find_function(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    find_function(value)
-            elif isinstance(node, list):
-                for item in node:
-                    find_function(item)
-
-        find_function(self)
+        index = get_index(self)
+        # Function nodes are the ones found at the end of a .fn access path
+        matching_nodes = [
+            node
+            for node in index.lookup(index.by_ident, function_names, self)
+            if node._access_path.ends_with("fn")
+        ]
         return ASTNodeList(matching_nodes)
 
     @dsl_log
+    @cached_query
     def find_all_functions(self) -> ASTNodeList:
         """Find all function nodes in the AST.
 
         Returns:
             ASTNodeList of all function nodes found.
         """
-        matching_nodes = []
-
-        def find_function(node):
-            if isinstance(node, ASTNode):
-                # Check if this is a function node by looking for .fn at the end of access path
-                if node.access_path.endswith(".fn"):
-                    matching_nodes.append(node)
-                for child in node.children:
-                    find_function(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    find_function(value)
-            elif isinstance(node, list):
-                for item in node:
-                    find_function(item)
-
-        find_function(self)
+        index = get_index(self)
+        # Function nodes are the ones found at the end of a .fn access path
+        matching_nodes = index.lookup(index.by_path_suffix, [segment_id("fn")], self)
         return ASTNodeList(matching_nodes)
 
     @dsl_log
+    @cached_query
     def find_by_names(self, *idents: tuple[str, ...]) -> ASTNodeList:
         """Find nodes by their identifier names.
 
@@ -678,26 +749,14 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes with the specified identifiers.
         """
-        matching_nodes = []
-
-        def search_nodes(node):
-            if isinstance(node, ASTNode):
-                if node.ident in idents:
-                    matching_nodes.append(node)
-                for child in node.children:
-                    search_nodes(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    if isinstance(value, (dict, list)):
-                        search_nodes(value)
-            elif isinstance(node, list):
-                for item in node:
-                    search_nodes(item)
-
-        search_nodes(self)
-        return ASTNodeList(matching_nodes)
+        index = get_index(self)
+        if index.columns is not None:
+            ordinals = index.columns.find_in(index.columns.ident, idents, self)
+            return ASTNodeList.from_ordinals(index, ordinals)
+        return ASTNodeList(index.lookup(index.by_ident, idents, self))
 
     @dsl_log
+    @cached_query
     def find_method_calls(self, caller: str, method: str) -> ASTNodeList:
         """Find method call nodes with specific caller and method names.
 
@@ -708,26 +767,18 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of method call nodes matching the caller and method criteria.
         """
-        matching_nodes = []
-
-        def recurse(node):
-            if isinstance(node, ASTNode):
-                if node.access_path.endswith("method_call") and node.ident == method:
-                    if node.children and node.children[0].ident == caller:
-                        matching_nodes.append(node)
-                for child in node.children:
-                    recurse(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    recurse(value)
-            elif isinstance(node, list):
-                for item in node:
-                    recurse(item)
-
-        recurse(self)
+        index = get_index(self)
+        matching_nodes = [
+            node
+            for node in index.lookup(index.by_ident, [method], self)
+            if node._access_path.ends_with("method_call")
+            and node.children
+            and node.children[0].ident == caller
+        ]
         return ASTNodeList(matching_nodes)
 
     @dsl_log
+    @cached_query
     def find_assignments(self, ident: str, value_ident: str) -> ASTNodeList:
         """Find assignment operations between specific identifiers.
 
@@ -740,70 +791,55 @@ class RustASTNode(ASTNode):
         """
         assignments = []
 
-        def traverse(node):
-            if not node:
-                return
-
-            if node.ident == ident and ".assign.left" in node.access_path:
-                assignment_path = node.access_path.split(".assign.left")[0] + ".assign"
-                right_node = find_node_by_access_path(assignment_path + ".right")
-                if right_node and check_conditions(node, right_node, value_ident):
-                    assignments.append(ASTNodeList([node, right_node]))
-
-            for child in node.children:
-                traverse(child)
-
-        def find_node_by_access_path(access_path):
-            matching_node = None
+        index = get_index(self)
 
-            def recurse(node):
-                nonlocal matching_node
-                if access_path in node.access_path:
-                    matching_node = node
-                    return
-                for child in node.children:
-                    recurse(child)
+        def find_node_by_access_path(access_path, key):
+            # The node on the other side of the same operation, found by its path prefix
+            return index.last_top_most_under(access_path, key, self)
 
-            recurse(self)
-            return matching_node
+        def assignment_base_path(access_path, side):
+            # The path the assignment hangs from, before its last ".assign.<side>"
+            assignment = access_path.rfind("assign", side)
+            return assignment.ancestor(assignment.depth - 2) if assignment else access_path
 
         def check_conditions(left_node, right_node, value_ident):
-            left_access_path = left_node.access_path.rsplit(".assign.left", 1)[0]
-            right_access_path = right_node.access_path.rsplit(".assign.right", 1)[0]
-            return left_access_path == right_access_path and right_node.ident == str(
+            left_access_path = assignment_base_path(left_node._access_path, "left")
+            right_access_path = assignment_base_path(right_node._access_path, "right")
+            return left_access_path is right_access_path and right_node.ident == str(
                 value_ident
             )
 
-        traverse(self)
+        # Nodes without an ident are not indexed
+        candidates = iter_subtree(self) if ident is None else index.lookup(index.by_ident, [ident], self)
+        for node in candidates:
+            if node.ident == ident and node._access_path.contains("assign", "left"):
+                assignment_path = node._access_path.find("assign", "left").parent
+                right_node = find_node_by_access_path(assignment_path, "right")
+                if right_node and check_conditions(node, right_node, value_ident):
+                    assignments.append(ASTNodeList([node, right_node]))
+
         return ASTNodeList(assignments)
 
     @dsl_log
+    @cached_query
     def find_mutables(self) -> ASTNodeList:
         """Find all nodes that are marked as mutable.
 
         Returns:
             ASTNodeList of nodes that have the 'mut' metadata flag set to True.
         """
-        mutables = []
-
-        def traverse(node):
-            if isinstance(node, ASTNode):
-                if hasattr(node, "metadata") and isinstance(node.metadata, dict):
-                    if node.metadata.get("mut") is True:
-                        mutables.append(node)
-                for child in node.children:
-                    traverse(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    traverse(value)
-            elif isinstance(node, list):
-                for item in node:
-                    traverse(item)
-
-        traverse(self)
+        index = get_index(self)
+        if index.columns is not None:
+            return ASTNodeList.from_ordinals(index, index.columns.find_mutables(self))
+        mutables = [
+            node
+            for node in index.lookup(index.by_metadata, [("mut", True)], self)
+            if node.metadata.get("mut") is True
+        ]
         return ASTNodeList(mutables)
 
     @dsl_log
+    @cached_query
     def find_account_typed_nodes(self, ident: str) -> ASTNodeList:
         """Find nodes that are typed as accounts with a specific identifier.
 
@@ -815,40 +851,38 @@ class RustASTNode(ASTNode):
         """
         matches = []
 
+        ty, path, segments = segment_id("ty"), segment_id("path"), segment_id("segments")
+
         def ends_with_ty_path_segments(access_path):
-            parts = access_path.split(".")
-            segments_index = -1
-            for i in range(len(parts)):
-                if parts[i] == "ty" and i + 1 < len(parts) and parts[i + 1] == "path":
-                    segments_index = i + 2
-                    break
-            if segments_index == -1:
-                return False
-            while segments_index < len(parts) and (
-                parts[segments_index].startswith("segments[")
-                or parts[segments_index] == "segments"
-            ):
-                segments_index += 1
-            return segments_index == len(parts)
-
-        def traverse(node):
-            if isinstance(node, ASTNode):
-                if ends_with_ty_path_segments(node.access_path):
-                    if node.parent.ident == ident:
-                        matches.append(node.parent)
-                for child in node.children:
-                    traverse(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    traverse(value)
-            elif isinstance(node, list):
-                for item in node:
-                    traverse(item)
-
-        traverse(self)
+            # Dotted parts of the path, as (key, whether list indexes follow the key)
+            parts = []
+            for segment in access_path.segments():
+                if segment >= 0:
+                    parts.append((segment, False))
+                elif parts:
+                    parts[-1] = (parts[-1][0], True)
+                else:
+                    parts.append((None, True))
+            for i in range(len(parts) - 1):
+                if parts[i] == (ty, False) and parts[i + 1] == (path, False):
+                    return all(key == segments for key, _ in parts[i + 2 :])
+            return False
+
+        # A match is reported once per typed child, in the pre-order of that child
+        index = get_index(self)
+        typed_children = [
+            child
+            for parent in index.by_ident.get(ident, [])
+            for child in parent.children
+            if index.contains(self, child)
+            and ends_with_ty_path_segments(child._access_path)
+        ]
+        typed_children.sort(key=lambda node: node._enter)
+        matches = [child.parent for child in typed_children]
         return ASTNodeList(matches)
 
     @dsl_log
+    @cached_query
     def find_member_accesses(self, ident: str) -> ASTNodeList:
         """Find member access operations for a specific identifier.
 
@@ -858,31 +892,19 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes representing member accesses of the specified identifier.
         """
-        member_accesses = []
-
-        def traverse(node):
-            if isinstance(node, ASTNode):
-                if (
-                    node
-                    and node.ident == ident
-                    and (
-                        "tokens" in node.access_path or "call.args" in node.access_path
-                    )
-                ):
-                    member_accesses.append(node)
-                for child in node.children:
-                    traverse(child)
-            elif isinstance(node, dict):
-                for key, value in node.items():
-                    traverse(value)
-            elif isinstance(node, list):
-                for item in node:
-                    traverse(item)
-
-        traverse(self)
+        index = get_index(self)
+        member_accesses = [
+            node
+            for node in index.lookup(index.by_ident, [ident], self)
+            if node._access_path.contains("tokens")
+            # Arguments of plain calls and of method calls
+            or node._access_path.contains("call", "args")
+            or node._access_path.contains("method_call", "args")
+        ]
         return ASTNodeList(member_accesses)
 
     @dsl_log
+    @cached_query
     def find_binary_operations(self, *operators: tuple[str, ...]) -> ASTNodeList:
         """Find binary operations with specific operators.
 
@@ -892,203 +914,278 @@ class RustASTNode(ASTNode):
         Returns:
             ASTNodeList of nodes that are involved in binary operations with the specified operators.
         """
+        index = get_index(self)
         matching_nodes = []
-        search_path_prefix = self.access_path if not self.root else ""
-        
-        all_nodes = getattr(self, "_all_nodes", [])
-        if not all_nodes:
-            all_nodes = [self]
-        
         seen_binary_paths = set()
-        for node in all_nodes:
-            if search_path_prefix and not node.access_path.startswith(search_path_prefix):
-                continue
-            
-            op = node.metadata.get("op")
-            if op and op in operators:
-                has_binary_child = False
-                for child in node.children:
-                    if child.access_path and ".binary." in child.access_path:
-                        has_binary_child = True
-                        break
-                
-                if has_binary_child:
-                    binary_base_path = node.access_path
-                    if binary_base_path not in seen_binary_paths:
-                        matching_nodes.append(node)
-                        seen_binary_paths.add(binary_base_path)
+
+        def below_binary(access_path):
+            # Any position inside a binary expression, i.e. a ".binary." in the dotted path
+            binary = access_path.find("binary")
+            return binary is not None and binary is not access_path and binary.depth > 1
+
+        for node in index.lookup(
+            index.by_metadata, [("op", operator) for operator in operators], self
+        ):
+            has_binary_child = any(
+                below_binary(child._access_path) for child in node.children
+            )
+            if has_binary_child and node._access_path not in seen_binary_paths:
+                matching_nodes.append(node)
+                seen_binary_paths.add(node._access_path)
 
         return ASTNodeList(matching_nodes)
 
+    @dsl_log
+    @cached_query
+    def find_enclosing_function(self) -> ASTNodeList:
+        """Find the innermost function declaration enclosing this node.
 
-def serialize_rust_ast(ast, access_path="", parent=None) -> list:
-    """Serialize a Rust AST into a list of RustASTNode objects.
+        Returns:
+            ASTNodeList holding the enclosing function node, or an empty list.
+        """
+        index = get_index(self)
+        functions = index.by_path_suffix.get(segment_id("fn"), [])
+        function = index.enclosing(functions, self)
+        return ASTNodeList([function] if function is not None else [])
 
-    Args:
-        ast: The AST data structure to serialize (dict or list).
-        access_path: The current access path for nested elements (default: "").
-        parent: The parent RustASTNode object (default: None).
+    @dsl_log
+    @cached_query
+    def find_ancestors_by_names(self, *idents: tuple[str, ...]) -> ASTNodeList:
+        """Find the ancestors of this node that have specific identifiers.
 
-    Returns:
-        List of RustASTNode objects representing the serialized AST.
+        Args:
+            *idents: Variable number of identifiers to search for.
+
+        Returns:
+            ASTNodeList of matching ancestors, outermost first.
+        """
+        index = get_index(self)
+        ancestors = index.ancestors(index.lookup(index.by_ident, idents, index.root), self)
+        return ASTNodeList(ancestors)
+
+
+def source_of(node) -> str:
+    """Return the source file a parsed node belongs to."""
+    return node.src.get("file") if node.src else "unknown"
+
+
+class RustTreeBuilder:
+    """Builds one tree per source file while serializing a Rust AST, in a single pass.
+
+    A node is attached to the closest node found at an enclosing position of the AST (the
+    "anchor", kept per source file since a subtree may mix files) and to the root of its source
+    file when there is none. Mutable nodes correlated with an ident further down are only
+    placed once the walk reaches that ident, so nodes temporarily hold their creation number in
+    _enter (renumbered by ASTIndex afterwards) to be inserted among their siblings in order.
     """
-    nodes = []
-    if isinstance(ast, dict):
-        # Match - include nodes that has src and ident keys
-        if "src" in ast and "ident" in ast:
-            metadata = {}
-            if "mut" in ast:
-                metadata["mut"] = ast["mut"]
-            node = RustASTNode(ast, access_path, metadata)
-            node.parent = parent
-            nodes.append(node)
-            parent = node
-
-        # Mutable but no ident edge case, corelate a mutable statement with the closest ident
-        elif "mut" in ast:
-            metadata = {"mut": ast["mut"]}
-
-            def find_ident_src_node(sub_data, sub_access_path):
-                if isinstance(sub_data, dict):
-                    # Match
-                    if "src" in sub_data and "ident" in sub_data:
-                        return RustASTNode(sub_data, sub_access_path, metadata)
-
-                    # Look deeper
-                    for key, value in sub_data.items():
-                        new_path = (
-                            f"{sub_access_path}.{key}" if sub_access_path else key
-                        )
-                        result = find_ident_src_node(value, new_path)
-                        if result:
-                            return result
 
+    def __init__(self):
+        self.roots = {}
+        # Mutable nodes waiting for the access path of the ident they were correlated with,
+        # by id of that ident's dict
+        self.mut_nodes = {}
+        self.created = 0
+
+    def root(self, source) -> RustASTNode:
+        root = self.roots.get(source)
+        if root is None:
+            root = self.roots[source] = RustASTNode()
+        return root
+
+    def create(self, data, access_path, metadata, parent) -> RustASTNode:
+        node = RustASTNode(data, access_path, metadata)
+        node.parent = parent
+        node._enter = self.created
+        self.created += 1
+        self.root(source_of(node))
+        return node
+
+    def attach(self, node, anchors):
+        """Attach a node to its anchor, or to its source root if it has neither anchor nor parent."""
+        source = source_of(node)
+        while anchors is not None:
+            anchor, anchor_source, anchors = anchors
+            if anchor_source == source:
+                self.insert(anchor, node)
+                return
+        if node.parent is None:
+            self.insert(self.roots[source], node)
+
+    @staticmethod
+    def insert(parent, node):
+        """Add a child, keeping the children of parent in creation order."""
+        children = parent.children
+        if not children or children[-1]._enter < node._enter:
+            parent.add_child(node)
+            return
+        position = len(children)
+        while position and children[position - 1]._enter > node._enter:
+            position -= 1
+        children.insert(position, node)
+        node.parent = parent
+
+    @staticmethod
+    def find_first_ident_data(data):
+        """Find the first dict holding src and ident keys in a value, in serialization order."""
+        stack = [data]
+        while stack:
+            data = stack.pop()
+            if isinstance(data, dict):
+                # Match
+                if "src" in data and "ident" in data:
+                    return data
                 # Look deeper
-                elif isinstance(sub_data, list):
-                    for i, item in enumerate(sub_data):
-                        new_path = f"{sub_access_path}[{i}]"
-                        result = find_ident_src_node(item, new_path)
-                        if result:
-                            return result
-                return None
-
-            node = find_ident_src_node(ast, access_path)
-            if node:
-                node.parent = parent
-                nodes.append(node)
+                stack.extend(reversed(data.values()))
+            # Look deeper
+            elif isinstance(data, list):
+                stack.extend(reversed(data))
+        return None
+
+    def serialize(self, ast):
+        """Serialize a Rust AST, attaching the nodes to the trees as they are created.
+
+        The AST is walked in pre-order with an explicit stack of
+        (value, access path, closest enclosing node, anchors) entries, where anchors is the
+        chain of (node, source, anchors) of the closest enclosing nodes whose children can be
+        attached to them.
+
+        Args:
+            ast: The AST data structure to serialize (dict or list).
+        """
+        stack = [(ast, EMPTY_ACCESS_PATH, None, None)] if isinstance(ast, (dict, list)) else []
+        while stack:
+            ast, access_path, parent, anchors = stack.pop()
+
+            # Look deeper
+            if isinstance(ast, list):
+                for i in range(len(ast) - 1, -1, -1):
+                    item = ast[i]
+                    if isinstance(item, (dict, list)):
+                        stack.append((item, access_path.index(i), parent, anchors))
+                continue
+
+            # Match - include nodes that has src and ident keys
+            if "src" in ast and "ident" in ast:
+                metadata = {}
+                if "mut" in ast:
+                    metadata["mut"] = ast["mut"]
+                node = self.create(ast, access_path, metadata, parent)
+
+                # Mutable nodes correlated with this ident share its access path object. Only the
+                # first node created for a path is attached to an anchor, the later ones are
+                # left out of the tree unless they are top level
+                mut_nodes = self.mut_nodes.pop(id(ast), None)
+                if mut_nodes:
+                    for mut_node in mut_nodes:
+                        mut_node._access_path = access_path
+                    self.attach(mut_nodes[0], anchors)
+                    for placed_node in mut_nodes[1:] + [node]:
+                        self.attach(placed_node, None)
+                else:
+                    self.attach(node, anchors)
                 parent = node
+                if access_path.depth:
+                    anchors = (node, source_of(node), anchors)
+
+            # Mutable but no ident edge case, corelate a mutable statement with the closest ident
+            elif "mut" in ast:
+                ident_data = self.find_first_ident_data(ast)
+                if ident_data:
+                    # The access path is set and the node attached once the walk reaches the ident
+                    node = self.create(ident_data, EMPTY_ACCESS_PATH, {"mut": ast["mut"]}, parent)
+                    self.mut_nodes.setdefault(id(ident_data), []).append(node)
+                    parent = node
+
+            # Capture binary operator information
+            if "op" in ast and parent:
+                if parent._metadata is None:
+                    parent._metadata = {}
+                parent._metadata["op"] = ast["op"]
+
+            # Also capture operator from binary expressions (syn AST structure)
+            binary_anchors = None
+            if "binary" in ast and isinstance(ast["binary"], dict) and "op" in ast["binary"]:
+                # Find the first ident node in the left side to use its src location
+                left_node_data = self.find_first_ident_data(ast["binary"].get("left", {}))
+                if left_node_data:
+                    # Create a node for the binary operator
+                    binary_op = ast["binary"]["op"]
+                    binary_node_data = {
+                        "src": left_node_data["src"],
+                        "ident": binary_op
+                    }
+                    binary_node = self.create(
+                        binary_node_data,
+                        access_path.key("binary"),
+                        {"op": binary_op},
+                        parent,
+                    )
+                    self.attach(binary_node, anchors)
+                    binary_anchors = (binary_node, source_of(binary_node), anchors)
+
+            # Look deeper
+            for key, value in reversed(ast.items()):
+                if not isinstance(value, (dict, list)):
+                    continue
+                # Operands of a binary node descend from the binary node's own access path
+                if key == "binary" and binary_anchors is not None:
+                    binary_node = binary_anchors[0]
+                    stack.append((value, binary_node._access_path, parent, binary_anchors))
+                else:
+                    stack.append((value, access_path.key(key), parent, anchors))
+
+
+def serialize_rust_ast(ast) -> dict:
+    """Serialize a Rust AST into one tree of RustASTNode objects per source file.
 
-        # Capture binary operator information
-        if "op" in ast and parent:
-            if not hasattr(parent, "metadata"):
-                parent.metadata = {}
-            parent.metadata["op"] = ast["op"]
-
-        # Also capture operator from binary expressions (syn AST structure)
-        if "binary" in ast and isinstance(ast["binary"], dict) and "op" in ast["binary"]:
-            # Find the first ident node in the left side to use its src location
-            def find_first_ident_node(data, path):
-                if isinstance(data, dict):
-                    if "src" in data and "ident" in data:
-                        return (data, path)
-                    for key, value in data.items():
-                        result = find_first_ident_node(value, f"{path}.{key}" if path else key)
-                        if result:
-                            return result
-                elif isinstance(data, list):
-                    for i, item in enumerate(data):
-                        result = find_first_ident_node(item, f"{path}[{i}]")
-                        if result:
-                            return result
-                return None
-            
-            # Create a node for the binary operator
-            left_result = find_first_ident_node(ast["binary"].get("left", {}), "")
-            if left_result:
-                left_node_data, _ = left_result
-                binary_op = ast["binary"]["op"]
-                binary_node_data = {
-                    "src": left_node_data["src"],
-                    "ident": binary_op
-                }
-                binary_node = RustASTNode(
-                    binary_node_data,
-                    f"{access_path}.binary",
-                    {"op": binary_op}
-                )
-                binary_node.parent = parent
-                nodes.append(binary_node)
-
-        # Look deeper
-        for key, value in ast.items():
-            new_path = f"{access_path}.{key}" if access_path else key
-            nodes.extend(serialize_rust_ast(value, new_path, parent))
-    
-    # Look deeper
-    elif isinstance(ast, list):
-        for i, item in enumerate(ast):
-            new_path = f"{access_path}[{i}]"
-            nodes.extend(serialize_rust_ast(item, new_path, parent))
-
-    return nodes
-
-
-def parse_ast(ast: dict, language: str = "rust") -> dict:
+    Args:
+        ast: The AST data structure to serialize (dict or list).
+
+    Returns:
+        Dictionary mapping source file names to their root RustASTNode objects.
+    """
+    builder = RustTreeBuilder()
+    builder.serialize(ast)
+    # Mutable nodes whose ident was never reached keep an empty access path
+    for mut_nodes in builder.mut_nodes.values():
+        for mut_node in mut_nodes:
+            builder.attach(mut_node, None)
+    return builder.roots
+
+
+def parse_ast(
+    ast: dict, language: str = "rust", columnar: bool = False, lazy: bool = False
+) -> dict:
     """Parse an AST dictionary into organized source-based node hierarchies.
 
     Args:
         ast: The AST dictionary to parse.
         language: Programming language ('rust' or 'solidity'). Defaults to 'rust'.
+        columnar: Also build the columnar store used for vectorized lookups. Defaults to False.
+        lazy: Evaluate method calls chained on node lists lazily. Defaults to False.
 
     Returns:
         Dictionary mapping source file names to their root ASTNode objects.
     """
     if language == "solidity":
         from utils.dsl.solidity import parse_solidity_ast
-        return parse_solidity_ast(ast)
+        return parse_solidity_ast(ast, columnar, lazy)
     else:
-        return parse_rust_ast(ast)
+        return parse_rust_ast(ast, columnar, lazy)
 
 
-def parse_rust_ast(ast: dict) -> dict:
+def parse_rust_ast(ast: dict, columnar: bool = False, lazy: bool = False) -> dict:
     """Parse Rust AST dictionary into organized source-based node hierarchies.
 
     Args:
         ast: The Rust AST dictionary to parse.
+        columnar: Also build the columnar store used for vectorized lookups.
+        lazy: Evaluate method calls chained on node lists lazily.
 
     Returns:
         Dictionary mapping source file names to their root RustASTNode objects.
     """
-    sources = {}
-    nodes = serialize_rust_ast(ast)
-
-    for node in nodes:
-        source = node.src.get("file") if node.src else "unknown"
-        if source not in sources:
-            sources[source] = []
-        sources[source].append(node)
-
-    roots = {}
-    for source, nodes in sources.items():
-        path_to_node = {node.access_path: node for node in nodes}
-        assigned_children = set()
-        for node in nodes:
-            if node.access_path in assigned_children:
-                continue
-            parent_path = ".".join(node.access_path.split(".")[:-1])
-            while parent_path:
-                parent_node = path_to_node.get(parent_path)
-                if parent_node:
-                    parent_node.add_child(node)
-                    assigned_children.add(node.access_path)
-                    break
-                parent_path = ".".join(parent_path.split(".")[:-1])
-        root = RustASTNode()
-        root._all_nodes = nodes
-        for node in nodes:
-            node._all_nodes = nodes
-            if not node.parent:
-                root.add_child(node)
-        roots[source] = root
-
+    roots = serialize_rust_ast(ast)
+    for root in roots.values():
+        ASTIndex(root, columnar, lazy)
     return roots
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from functools import wraps
+import threading
+from typing import Callable, Hashable, Optional
+
+# Maximum number of cached query results per parsed source
+QUERY_CACHE_MAX_ENTRIES = 1024
+
+# Estimated memory budget of the query cache of a tree, per node of the tree, so that a parsed
+# AST's footprint stays proportional to its size (see utils/dsl/ast_cache.py)
+QUERY_CACHE_BYTES_PER_NODE = 256
+
+# Rough footprint of a cached result: the entry, its key and result objects, plus one reference
+# per node it holds (measured with tracemalloc on parsed mock ASTs)
+QUERY_RESULT_BYTES = 640
+QUERY_RESULT_BYTES_PER_NODE = 8
+
+
+def estimate_result_bytes(result) -> int:
+    """Estimate the memory held by a cached query result."""
+    ref_count = getattr(result, "_ref_count", None)
+    node_refs = ref_count() if ref_count is not None else 0
+    return QUERY_RESULT_BYTES + node_refs * QUERY_RESULT_BYTES_PER_NODE
+
+
+class QueryCache:
+    """LRU cache of DSL query results for one parsed source tree.
+
+    Every template of a scan runs its queries on the same parsed tree, and many of them ask the
+    same questions (e.g. find_all_functions() or find_by_names("Signer")), so results are kept
+    per tree and keyed by receiver node, method and arguments. Trees are not modified after
+    parsing, so entries never go stale; the least recently used ones are evicted past
+    max_entries or once the estimated size of the results exceeds max_bytes.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_run(self, key: Hashable, run: Callable):
+        """Return the cached result for a key, running and caching the query on a miss.
+
+        Args:
+            key: Cache key identifying the receiver, method and arguments.
+            run: Callable running the query on a miss.
+
+        Returns:
+            The query result.
+        """
+        try:
+            hash(key)
+        except TypeError:
+            # Unhashable arguments (e.g. lists) are not cached
+            return run()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        result = run()
+        size = estimate_result_bytes(result)
+
+        with self._lock:
+            if self.max_entries <= 0 or key in self._entries:
+                return result
+            if self.max_bytes is not None and size > self.max_bytes:
+                return result
+            self._entries[key] = (result, size)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._total_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """Return cache counters.
+
+        Returns:
+            Dictionary with hits, misses, evictions, entry count, estimated bytes held and hit
+            rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def cached_query(method):
+    """Decorator memoizing a DSL query method in the query cache of the receiver's tree.
+
+    Nodes that are not part of a parsed tree are queried directly.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        index = self._index
+        if index is None:
+            return method(self, *args, **kwargs)
+        # Argument types are part of the key since e.g. 1 and True are equal but str() differently
+        key = (
+            self,
+            method.__name__,
+            args,
+            tuple(map(type, args)),
+            tuple(sorted(kwargs.items())),
+        )
+        return index.query_cache.get_or_run(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
+
+def query_cache_stats(roots: dict) -> dict:
+    """Sum the query cache counters of parsed source roots.
+
+    Args:
+        roots: Dictionary mapping source names to root nodes, as returned by parse_ast.
+
+    Returns:
+        Dictionary with hits, misses, evictions, entry count, estimated bytes held and hit rate.
+    """
+    totals = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+    for root in roots.values():
+        if root._index is None:
+            continue
+        stats = root._index.query_cache.stats()
+        for key in totals:
+            totals[key] += stats[key]
+    lookups = totals["hits"] + totals["misses"]
+    totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+    return totals
@@ -0,0 +1,140 @@
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import time
+
+# Marker attribute of the DSL methods that can be traced
+TRACED_ATTRIBUTE = "_dsl_traced"
+
+_state = threading.local()
+_install_lock = threading.Lock()
+_active_traces = 0
+# (class, method name) -> bare method, for the methods currently wrapped
+_originals = {}
+
+
+def dsl_log(func):
+    """Mark a DSL method as traceable.
+
+    The method itself is returned unchanged, so calls cost nothing unless a scan runs with
+    tracing, during which tracing() swaps a recording wrapper in.
+    """
+    setattr(func, TRACED_ATTRIBUTE, True)
+    return func
+
+
+class Trace:
+    """Structured events of the traced DSL calls made while a trace is active on this thread."""
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, function: str, args: tuple, kwargs: dict, result, elapsed: float, exit=None):
+        self.events.append(
+            {
+                "function": function,
+                "args": [_describe(arg) for arg in args]
+                + [f"{key}={_describe(value)}" for key, value in kwargs.items()],
+                "nodes": _node_count(result),
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "exit": exit,
+            }
+        )
+
+
+def _describe(value) -> str:
+    text = str(value)
+    return text[:50] + "..." if len(text) > 50 else text
+
+
+def _node_count(result):
+    # Lazy node lists are not evaluated just to be counted
+    if getattr(result, "_plan", None) is not None:
+        return None
+    if hasattr(result, "__len__"):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def _traced_classes():
+    from utils.dsl.dsl_ast_iterator import ASTNode, ASTNodeList, ASTNodeListGroup
+    import utils.dsl.solidity  # noqa: F401 registers SolidityASTNode as an ASTNode subclass
+
+    classes = [ASTNodeList, ASTNodeListGroup]
+    pending = [ASTNode]
+    while pending:
+        cls = pending.pop()
+        classes.append(cls)
+        pending.extend(cls.__subclasses__())
+    return classes
+
+
+def _recording(cls, name: str, func):
+    function = f"{cls.__name__}.{name}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = getattr(_state, "trace", None)
+        if trace is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except StopIteration as e:
+            elapsed = time.perf_counter() - started
+            trace.record(function, args[1:], kwargs, None, elapsed, f"StopIteration: {e}")
+            raise
+        trace.record(function, args[1:], kwargs, result, time.perf_counter() - started)
+        return result
+
+    return wrapper
+
+
+def _install():
+    for cls in _traced_classes():
+        for name, attribute in list(vars(cls).items()):
+            if getattr(attribute, TRACED_ATTRIBUTE, False) and (cls, name) not in _originals:
+                _originals[(cls, name)] = attribute
+                setattr(cls, name, _recording(cls, name, attribute))
+
+
+def _uninstall():
+    for (cls, name), attribute in _originals.items():
+        setattr(cls, name, attribute)
+    _originals.clear()
+
+
+@contextmanager
+def tracing(enabled: bool = True):
+    """Record the traced DSL calls made on this thread within the block.
+
+    The recording wrappers are only installed while at least one trace is active, and removed
+    again with the last one, so untraced scans call the bare methods.
+
+    Args:
+        enabled: Whether to trace at all; yields None when False.
+
+    Yields:
+        The Trace collecting the events, or None.
+    """
+    global _active_traces
+    if not enabled:
+        yield None
+        return
+
+    with _install_lock:
+        if _active_traces == 0:
+            _install()
+        _active_traces += 1
+
+    trace = Trace()
+    previous = getattr(_state, "trace", None)
+    _state.trace = trace
+    try:
+        yield trace
+    finally:
+        _state.trace = previous
+        with _install_lock:
+            _active_traces -= 1
+            if _active_traces == 0:
+                _uninstall()
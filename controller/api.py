@@ -153,11 +153,13 @@ def generate_ast_for_file_or_folder(path: Path, path_type: str):
         sys.exit(0)
 
 
-def run_scan(path: Path, path_type: str, templates_path: Path = None):
+def run_scan(path: Path, path_type: str, templates_path: Path = None, trace: bool = False):
     try:
         req_body = {"source_type": path_type, f"{path_type}_path": str(path)}
         if templates_path is not None:
             req_body["templates_path"] = str(templates_path)
+        if trace:
+            req_body["trace"] = True
 
         response = requests.post(
             f"{api_uri}/run_scan/",
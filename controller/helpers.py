@@ -187,10 +187,11 @@ def print_write_outputs(
         if finding.get("locations") and len(finding["locations"]) > 0
     ]
     
-    # Remove debug field from results if not in debug mode
+    # Remove debug and trace fields from results if not in debug mode
     if not debug:
         for finding in results:
             finding.pop("debug", None)
+            finding.pop("trace", None)
 
     if ast and "sources" in ast:
         file_count = len(ast["sources"])
@@ -209,6 +210,18 @@ def print_write_outputs(
                     )
                     for i in range(0, len(result["debug"])):
                         print(result['debug'][i])
+                if "trace" in result:
+                    print()
+                    print(
+                        f"[d] DSL trace of template \"{result.get('name', 'Unknown')}\""
+                    )
+                    for event in result["trace"]:
+                        # Lazy node lists are not counted by the trace
+                        nodes = event["nodes"]
+                        outcome = event["exit"] or ("lazy" if nodes is None else f"{nodes} nodes")
+                        print(
+                            f"[d] {event['function']}({', '.join(event['args'])}) -> {outcome} ({event['elapsed_ms']} ms)"
+                        )
 
     if len(results) == 0:
         if output_type == "sarif":
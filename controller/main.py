@@ -76,7 +76,7 @@ def main():
         local_path = Path(args.path)
 
     ast = generate_ast_for_file_or_folder(container_path, path_type)
-    run_scan(container_path, path_type, templates_path)
+    run_scan(container_path, path_type, templates_path, getattr(args, "debug", False))
     results = poll_results(container_path, path_type, local_path)
     
     print_write_outputs(